@@ -5,17 +5,24 @@ Date: Feb 23, 2022
 """
 import numpy as np
 
-def sigmoid(arg):
+def sigmoid(arg, out=None):
     """The sigmoid activation function returns the value of the 
-    sigmoid function for the given argument value."""
-    return 1/(1 + np.exp(-arg))
+    sigmoid function for the given argument value. Arrays are
+    evaluated element-wise, in place into `out` if it is given."""
+    if out is None:
+        return 1/(1 + np.exp(-arg))
 
+    np.negative(arg, out=out)
+    np.exp(out, out=out)
+    out += 1
+    return np.divide(1, out, out=out)
 
-def relu(arg):
+
+def relu(arg, out=None):
     """The Relu activation function returns 0 if the arg is less than
     0, and the identity function otherwise."""
-    return max(0, arg)
+    return np.maximum(0, arg, out=out)
 
 
-def tanh(arg):
-    return np.tanh(arg)
+def tanh(arg, out=None):
+    return np.tanh(arg, out=out)
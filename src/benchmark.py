@@ -0,0 +1,199 @@
+"""
+benchmark.py
+
+Measures the hot paths of the simulation one at a time and writes the
+results as JSON, so that versions can be compared with each other:
+
+- NeuralNet.evaluate calls per second, recording and inference only
+- Skeleton.move steps per second for chain lengths 0 to 20, next to the
+  batched PopulationBody.move in agent steps per second with each
+  constraint solver
+- Scorer.update calls per second
+- Simulation generations per second for several population sizes
+
+Every measurement is the best of a few repeats of a timed loop.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import kernels
+from agent import Agent
+from body import Skeleton, ConstraintSolver
+from main import Simulation
+from noise import NoiseStream
+from population_body import PopulationBody
+from scorer import Scorer
+from vector import Vector2
+
+
+def rate(func, min_time, repeats=3):
+    """Returns the best rate (calls per second) at which func runs over
+    `repeats` loops of at least `min_time` seconds each."""
+    best = 0
+    for _ in range(repeats):
+        calls = 0
+        start = time.perf_counter()
+        elapsed = 0
+        while elapsed < min_time:
+            for _ in range(100):
+                func()
+            calls += 100
+            elapsed = time.perf_counter() - start
+        best = max(best, calls / elapsed)
+    return best
+
+
+def bench_net(min_time):
+    """NeuralNet.evaluate calls per second."""
+    net = Agent(3).net
+    data = np.random.uniform(-1, 1, net.input_size)
+
+    results = []
+    for inference_only in (False, True):
+        results.append({
+            "name": "NeuralNet.evaluate",
+            "params": {"inference_only": inference_only},
+            "value": rate(lambda: net.evaluate(data, inference_only=inference_only), min_time),
+            "unit": "calls/s",
+        })
+    return results
+
+
+def bench_skeleton(min_time, chain_lengths, num_agents):
+    """Skeleton.move steps per second and PopulationBody.move agent
+    steps per second for each chain length, backend and constraint solver."""
+    results = []
+    for chain_length in chain_lengths:
+        points, sticks = Agent.skeleton_shape(chain_length)
+        noise = NoiseStream(len(points) - 1, seed=0)
+        _, acc_noise = noise.next_block()
+
+        # the base is locked to the agent, like Agent does
+        skeleton = Skeleton(points, sticks)
+        skeleton.force_pos(0, Vector2(points[0]))
+        results.append({
+            "name": "Skeleton.move",
+            "params": {"chain_length": chain_length},
+            "value": rate(lambda: skeleton.move(1/60, acc_noise[0]), min_time),
+            "unit": "steps/s",
+        })
+
+        rows = np.arange(num_agents)
+        population_noise = np.tile(acc_noise[0], (num_agents, 1))
+        for backend in kernels.BACKENDS:
+            if kernels.resolve_backend(backend) != backend:
+                continue
+
+            for method in ConstraintSolver.METHODS:
+                body = PopulationBody(num_agents, points, sticks, backend=backend, solver=ConstraintSolver(method=method))
+                body.move(rows, 1/60, population_noise) # compiles the kernels
+                results.append({
+                    "name": "PopulationBody.move",
+                    "params": {"chain_length": chain_length, "num_agents": num_agents, "backend": backend, "solver": method},
+                    "value": num_agents * rate(lambda: body.move(rows, 1/60, population_noise), min_time),
+                    "unit": "agent steps/s",
+                })
+    return results
+
+
+def bench_scorer(min_time):
+    """Scorer.update calls per second on an upright skeleton."""
+    points, sticks = Agent.skeleton_shape(3)
+    skeleton = Skeleton(points, sticks)
+    skeleton.force_pos(0, Vector2(points[0]))
+    scorer = Scorer()
+    return [{
+        "name": "Scorer.update",
+        "params": {"chain_length": 3},
+        "value": rate(lambda: scorer.update(skeleton), min_time),
+        "unit": "calls/s",
+    }]
+
+
+def bench_simulation(population_sizes, epochs, chain_length):
+    """Headless Simulation generations per second for each population
+    size, with a tenth of the agents reproducing."""
+    results = []
+    for num_agents in population_sizes:
+        # the best net is saved when the run ends
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sim = Simulation(num_agents, do_graphics=False, num_reproducing=max(1, num_agents // 10), epochs=epochs,
+                             chain_length=chain_length, seed=0, checkpoint_every=0,
+                             savefile=os.path.join(tmpdir, "benchmark"))
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                # the last epoch runs every agent to the end, like in training
+                sim.run()
+            elapsed = time.perf_counter() - start
+
+        results.append({
+            "name": "Simulation.run",
+            "params": {"num_agents": num_agents, "epochs": epochs, "chain_length": chain_length},
+            "value": epochs / elapsed,
+            "unit": "generations/s",
+        })
+    return results
+
+
+def git_commit():
+    """Returns the commit of the checkout, or None outside of git."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-o", "--outfile", metavar="OUTPUT_FILEPATH", type=str, default="benchmark.json", help="the JSON file the results are written to (default: benchmark.json)")
+    parser.add_argument("-t", "--min-time", metavar="SECONDS", type=float, default=0.2, help="minimum duration of each timed loop (default: 0.2)")
+    parser.add_argument("-a", "--agents", metavar="NUMBER_OF_AGENTS", type=int, nargs="+", default=[50, 200, 1000], help="population sizes of the Simulation benchmark (default: 50 200 1000)")
+    parser.add_argument("-e", "--epochs", metavar="NUMBER_OF_EPOCHS", type=int, default=3, help="epochs run by the Simulation benchmark (default: 3)")
+    parser.add_argument("--quick", action="store_true", help="fewer chain lengths and population sizes, for a fast check")
+    args = parser.parse_args()
+
+    chain_lengths = [0, 3, 10, 20] if args.quick else list(range(21))
+    population_sizes = args.agents[:1] if args.quick else args.agents
+
+    results = []
+    for name, bench in (
+        ("nets", lambda: bench_net(args.min_time)),
+        ("skeletons", lambda: bench_skeleton(args.min_time, chain_lengths, 200)),
+        ("scorers", lambda: bench_scorer(args.min_time)),
+        ("simulations", lambda: bench_simulation(population_sizes, args.epochs, 3)),
+    ):
+        print(f"[benchmark]: {name}")
+        for result in bench():
+            params = ", ".join(f"{k}={v}" for k, v in result["params"].items())
+            print(f"  {result['name']}({params}): {result['value']:.1f} {result['unit']}")
+            results.append(result)
+
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "numba": kernels.numba.__version__ if kernels.resolve_backend("numba") == "numba" else None,
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(args.outfile, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[benchmark]: results written to {args.outfile}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,18 +5,62 @@ Uses points and sticks to define skeletons for the agent's
 in the simulated environment.
 """
 
-import random
+import numpy as np
 
-import pygame
-from pygame.math import Vector2
-
-import graphics
+from vector import Vector2
+from chain_solver import is_chain, inverse_masses, chain_errors, solve_chains
 from constants import *
 
+
+class ConstraintSolver:
+    """How the stick constraints of a skeleton are satisfied after each
+    move: by up to `iterations` passes of the solver `method`. With a
+    tolerance, the passes stop as soon as no stick's length is off from
+    its rest length by more than `tolerance` times the rest length.
+    Without one, exactly `iterations` passes are run.
+
+    The "relax" method relaxes one stick after another in each pass. The
+    "chain" method solves for every stick of a chain at once in each
+    pass, see chain_solver.py."""
+
+    __slots__ = ("iterations", "tolerance", "method")
+
+    # Solver methods and the number of passes each runs by default
+    METHODS = {"relax": 3, "chain": 1}
+
+    def __init__(self, iterations=None, tolerance=None, method="relax"):
+        """Default constructor.
+
+        kwargs:
+        - iterations=None (int): The number of passes, or the most of them
+                                 with a tolerance. The default of the
+                                 method when None.
+        - tolerance=None (float): The largest relative stick length error
+                                  left unsolved. Always runs `iterations`
+                                  passes when None.
+        - method="relax" (str): "relax" or "chain".
+
+        Returns: None
+        """
+        if method not in ConstraintSolver.METHODS:
+            raise Exception(f"unknown constraint solver {method}, expected one of {tuple(ConstraintSolver.METHODS)}")
+        self.iterations = ConstraintSolver.METHODS[method] if iterations is None else iterations
+        self.tolerance = tolerance
+        self.method = method
+
+
+    def __repr__(self):
+        return f"ConstraintSolver(iterations={self.iterations}, tolerance={self.tolerance}, method={self.method!r})"
+
+
+# Three passes, which is how skeletons have always been relaxed
+DEFAULT_SOLVER = ConstraintSolver()
+
+
 class Skeleton:
     """Represents a rigid body structure and it's constraints."""
 
-    def __init__(self, points, sticks, old_points=None):
+    def __init__(self, points, sticks, old_points=None, solver=DEFAULT_SOLVER):
         """Creates a new Skeleton from a list of points.
 
         Parameters:
@@ -25,6 +69,8 @@ class Skeleton:
 
         kwargs:
         - old_points=None [(x, y)]: Used to give points an initial velocity.
+        - solver=DEFAULT_SOLVER (ConstraintSolver): How the sticks are
+                                                    kept at their lengths.
 
         Returns: None
         """
@@ -42,38 +88,54 @@ class Skeleton:
         # Sticks are defined as (p1, p2, distance)
         self.sticks = [(a, b, self.points[a].distance_to(self.points[b])) for (a, b) in sticks]
 
+        self.solver = solver
+        if solver.method == "chain" and not is_chain(self.sticks):
+            raise Exception("the chain solver needs stick i to join point i to point i + 1")
 
-    def move(self, delta_t):
+
+    def move(self, delta_t, acc_noise):
         """Verlet Integration step.
 
         Parameters:
         - delta_t (float): The amount of time to step forward.
+        - acc_noise [float]: The noise added to the acceleration of each
+                             point that is not locked, in order.
 
-        Returns: None
+        Returns: The number of constraint passes run (int)
         """
         # Iterate through the points and move them according to the Verlet
         # integration routine.
-        for i, point in enumerate(self.points):
-            if i not in self.locked_points:
-                acc_noise = random.uniform(-ROD_ACC_NOISE, ROD_ACC_NOISE)
-                acceleration = Vector2((0 + acc_noise, 100 + acc_noise))
-                current_pos = Vector2(point) # Avoids alias issues
-                old_pos = self.old_points[i]
-
-                self.points[i] += (current_pos - old_pos)*0.999 + acceleration*delta_t**2
-                old_pos.update(current_pos)
+        free_points = [i for i, _ in enumerate(self.points) if i not in self.locked_points]
+        if len(acc_noise) != len(free_points):
+            raise Exception(f"expected acceleration noise for {len(free_points)} free points, got {len(acc_noise)}")
+        for i, noise in zip(free_points, acc_noise):
+            point = self.points[i]
+            acceleration = Vector2((0 + noise, 100 + noise))
+            current_pos = Vector2(point) # Avoids alias issues
+            old_pos = self.old_points[i]
+
+            self.points[i] += (current_pos - old_pos)*0.999 + acceleration*delta_t**2
+            old_pos.update(current_pos)
 
         # After moving the points, satisfy the constraints
-        self.satisfy_constraints()
+        return self.satisfy_constraints()
 
 
     def satisfy_constraints(self):
         """Satisfies bounds and stick constraints between points.
 
-        Returns: None
+        Returns: The number of passes run (int)
         """
-        # Number of iterations to satisfy constraints
-        for _ in range(3):
+        if self.solver.method == "chain":
+            return self.__solve_chain()
+
+        tolerance = self.solver.tolerance
+        passes = 0
+        while passes < self.solver.iterations:
+            if tolerance is not None and self.stick_error() <= tolerance:
+                break
+            passes += 1
+
             #TODO Other worldly constraints go here
 
             for stick in self.sticks:
@@ -93,6 +155,40 @@ class Skeleton:
                 if stick[1] not in self.locked_points:
                     pos_2 -= delta*0.5*diff
 
+        return passes
+
+
+    def __solve_chain(self):
+        """Satisfies the stick constraints with the direct chain solver.
+
+        Returns: The number of passes run (int)
+        """
+        points = np.array([[(p.x, p.y) for p in self.points]])
+        rest_lengths = np.array([stick[2] for stick in self.sticks])
+        inv_mass = inverse_masses(len(self.points), self.locked_points)
+
+        tolerance = self.solver.tolerance
+        passes = 0
+        while passes < self.solver.iterations:
+            if tolerance is not None and chain_errors(points, rest_lengths)[0] <= tolerance:
+                break
+            passes += 1
+            solve_chains(points, rest_lengths, inv_mass)
+
+        # locked points may be shared with their owner, so only the free
+        # points are written back
+        for i, point in enumerate(self.points):
+            if i not in self.locked_points:
+                point.update(float(points[0, i, 0]), float(points[0, i, 1]))
+        return passes
+
+
+    def stick_error(self):
+        """Returns the largest difference between the length of a stick
+        and its rest length, relative to the rest length (float)."""
+        return max((abs(self.points[a].distance_to(self.points[b]) - length) / length
+                    for (a, b, length) in self.sticks), default=0.0)
+
 
     def force_pos(self, point_index, position : Vector2):
         """Forces a point to a given position.
@@ -129,6 +225,7 @@ class Skeleton:
 
         Returns: None
         """
+        import pygame
 
         # Set the zero to the middle of the screen
         # two thirds of the way down
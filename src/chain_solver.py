@@ -0,0 +1,93 @@
+"""
+chain_solver.py
+
+A direct solver for the stick constraints of a chain, where stick i joins
+point i to point i + 1 like the pole and mace of an agent. Relaxation
+passes fix one stick at a time, so a correction only travels one stick
+down the chain per pass and long chains stay stretched. Here the
+constraints of all sticks are linearized together instead, which gives a
+tridiagonal system with one unknown per stick. It is solved directly
+with the Thomas algorithm, for many chains at once, and the points are
+moved by the resulting projection. Each solve is a Newton step towards
+every stick being at its rest length, so one or two of them are enough.
+
+Every free point has the same mass and locked points do not move, like
+in the relaxation.
+"""
+
+import numpy as np
+
+
+def is_chain(sticks):
+    """Returns True if stick i joins point i to point i + 1 for every
+    stick, which the chain solver relies on."""
+    return all(stick[0] == i and stick[1] == i + 1 for i, stick in enumerate(sticks))
+
+
+def inverse_masses(num_points, locked_points):
+    """Returns the inverse mass of each point: 1 for free points and 0
+    for locked ones."""
+    inv_mass = np.ones(num_points)
+    inv_mass[list(locked_points)] = 0
+    return inv_mass
+
+
+def chain_errors(points, rest_lengths):
+    """Returns the largest difference between the length of a stick and
+    its rest length, relative to the rest length, of each chain in an
+    (M, P, 2) array of points."""
+    delta = points[:, 1:] - points[:, :-1]
+    length = np.sqrt(delta[..., 0]*delta[..., 0] + delta[..., 1]*delta[..., 1])
+    return (np.abs(length - rest_lengths) / rest_lengths).max(axis=1, initial=0)
+
+
+def solve_chains(points, rest_lengths, inv_mass):
+    """Projects the points of M chains onto their stick constraints by
+    one direct solve of the linearized constraints, in place.
+
+    With n_i the direction of stick i and C_i how much longer than its
+    rest length it is, the multipliers l of the sticks solve the
+    tridiagonal system
+
+        (w_i + w_i+1) l_i - w_i n_i-1.n_i l_i-1 - w_i+1 n_i.n_i+1 l_i+1 = C_i
+
+    where w are the inverse masses, and point j moves by
+    w_j (l_j n_j - l_j-1 n_j-1).
+
+    Parameters:
+    - points (ndarray): An (M, P, 2) array of the points of M chains.
+    - rest_lengths (ndarray): The rest length of each of the P - 1 sticks.
+    - inv_mass (ndarray): The inverse mass of each of the P points.
+
+    Returns: None
+    """
+    num_sticks = len(rest_lengths)
+
+    delta = points[:, 1:] - points[:, :-1]
+    length = np.sqrt(delta[..., 0]*delta[..., 0] + delta[..., 1]*delta[..., 1])
+    normal = delta / length[..., None]
+    error = length - rest_lengths
+
+    # The diagonal is the same for every chain, the off diagonal couples
+    # each stick to the next through the point they share
+    diag = inv_mass[:-1] + inv_mass[1:]
+    off = -inv_mass[1:-1] * (normal[:, :-1, 0]*normal[:, 1:, 0] + normal[:, :-1, 1]*normal[:, 1:, 1])
+
+    # Thomas algorithm, one stick at a time for all chains: eliminate
+    # the lower diagonal, then substitute back up the chain
+    upper = np.empty_like(off)
+    multipliers = np.empty_like(error)
+    multipliers[:, 0] = error[:, 0] / diag[0]
+    if num_sticks > 1:
+        upper[:, 0] = off[:, 0] / diag[0]
+    for i in range(1, num_sticks):
+        denom = diag[i] - off[:, i-1]*upper[:, i-1]
+        if i < num_sticks - 1:
+            upper[:, i] = off[:, i] / denom
+        multipliers[:, i] = (error[:, i] - off[:, i-1]*multipliers[:, i-1]) / denom
+    for i in range(num_sticks - 2, -1, -1):
+        multipliers[:, i] -= upper[:, i]*multipliers[:, i+1]
+
+    impulse = multipliers[..., None]*normal
+    points[:, :-1] += inv_mass[:-1, None]*impulse
+    points[:, 1:] -= inv_mass[1:, None]*impulse
@@ -0,0 +1,39 @@
+"""
+checkpoint.py
+
+Saves and restores the state of a training run between generations so a
+long run can be resumed after a crash or an interruption. Checkpoints are
+uncompressed NumPy .npz archives, which are cheap to write, and they are
+replaced atomically so an interrupted write never corrupts the last one.
+"""
+
+import os
+
+import numpy as np
+
+
+def save_checkpoint(path, **state):
+    """Writes the given arrays to a checkpoint at `path`.
+
+    Parameters:
+    - path (str): The checkpoint file, replaced if it exists.
+    - **state: The arrays (or values convertible to arrays) to save.
+
+    Returns: None
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **state)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """Reads a checkpoint written by save_checkpoint.
+
+    Parameters:
+    - path (str): The checkpoint file.
+
+    Returns: A dict mapping the names of the saved arrays to the arrays.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
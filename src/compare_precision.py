@@ -0,0 +1,121 @@
+"""
+compare_precision.py
+
+Compares simulating saved nets in float32 with simulating them in
+float64. Every net is run over the same noise seeds in both precisions,
+side by side, and for each net the report shows the score distribution
+in each precision and the frames at which the float32 trajectories
+diverge from the float64 ones.
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from neural_net import NeuralNet
+from population import Population
+from population_net import PopulationNet
+from constants import SUCCESS_THRESHOLD
+
+
+def find_nets(path):
+    """Returns the (name, NeuralNet) pairs of the saved nets in a file or
+    under a directory, skipping files that are not nets, such as score
+    stats."""
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+
+    nets = []
+    for net_path in paths:
+        try:
+            net = NeuralNet.net_from_file(net_path)
+        except Exception:
+            continue
+        if isinstance(net, NeuralNet):
+            nets.append((os.path.relpath(net_path, path) if net_path != path else net_path, net))
+    return nets
+
+
+def compare(net, trials, seed, tolerance, delta_t=1/60):
+    """Runs `trials` episodes of a net in float64 and in float32.
+
+    Parameters:
+    - net (NeuralNet): The net to run.
+    - trials (int): The number of episodes, each with its own noise.
+    - seed (int): The seed the noise of the episodes is derived from.
+    - tolerance (float): The distance in pixels between the float32 and
+                         float64 positions of a point at which their
+                         trajectories count as diverged.
+
+    kwargs:
+    - delta_t=1/60 (float): The number of seconds in a frame.
+
+    Returns: (float64 scores, float32 scores, divergence frames) as
+             ndarrays with one entry per episode. The divergence frame is
+             -1 for episodes that never diverged.
+    """
+    chain_length = net.input_size - 3
+    shapes = [w.shape for w in net.weights]
+    genomes = np.tile(net.genome(), (trials, 1))
+    seeds = [[seed, trial] for trial in range(trials)]
+
+    populations = [
+        Population(PopulationNet.from_genomes(genomes.astype(dtype), shapes, net.activations[1:]), chain_length, seeds=seeds)
+        for dtype in (np.float64, np.float32)
+    ]
+    exact, fast = populations
+
+    diverged = np.full(trials, -1)
+    while len(exact.alive) or len(fast.alive):
+        for population in populations:
+            population.step(delta_t)
+
+        # An episode has diverged once a point is too far from where it
+        # should be, or once it ended in one precision only
+        distance = np.abs(exact.body.points - fast.body.points).max(axis=(1, 2))
+        apart = (distance > tolerance) | (exact.scorer.running != fast.scorer.running)
+        diverged[(diverged < 0) & apart] = exact.scorer.frame
+
+    return exact.scorer.get_scores(), fast.scorer.get_scores(), diverged
+
+
+def describe(scores):
+    """Returns a one line summary of a score distribution."""
+    success = np.mean(scores >= SUCCESS_THRESHOLD)
+    return (f"mean {scores.mean():8.1f}  min {scores.min():6d}  median {np.median(scores):8.1f}  "
+            f"max {scores.max():6d}  success {success:6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-i", "--nets", metavar="PATH", type=str, default=os.path.join(os.path.dirname(__file__), "..", "successful_nets"), help="a saved net or a directory of saved nets (default: successful_nets)")
+    parser.add_argument("-t", "--trials", metavar="NUMBER_OF_TRIALS", type=int, default=20, help="number of episodes per net (default: 20)")
+    parser.add_argument("--seed", metavar="SEED", type=int, default=0, help="seed of the noise of the episodes (default: 0)")
+    parser.add_argument("--tolerance", metavar="PIXELS", type=float, default=1.0, help="distance between the float32 and float64 positions of a point at which an episode counts as diverged (default: 1)")
+    args = parser.parse_args()
+
+    nets = find_nets(args.nets)
+    if not nets:
+        print(f"[compare_precision]: no saved nets found in {args.nets}")
+        return
+
+    for name, net in nets:
+        exact, fast, diverged = compare(net, args.trials, args.seed, args.tolerance)
+
+        print(f"\n{name}")
+        print(f"  float64  {describe(exact)}")
+        print(f"  float32  {describe(fast)}")
+        print(f"  same score in {np.mean(exact == fast):.1%} of episodes")
+        if np.any(diverged >= 0):
+            frames = diverged[diverged >= 0]
+            print(f"  diverged in {len(frames)}/{args.trials} episodes, "
+                  f"first at frame {frames.min()}, median frame {np.median(frames):.0f}")
+        else:
+            print(f"  never diverged by more than {args.tolerance} pixels")
+
+
+if __name__ == "__main__":
+    main()
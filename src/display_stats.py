@@ -1,46 +1,191 @@
 from math import ceil
 import os
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+import multiprocessing
+import numpy as np
 import pickle
 import argparse
 from constants import RANDOM_MIXIN
+from stats_file import is_stats_file, read_stats
 
 
-def display(path, frame_duration, outdir):
+def load(path):
+    """Returns the scores of every epoch in a stats file or in a pickle
+    of score lists written by older versions."""
+    if is_stats_file(path):
+        return read_stats(path)
+
     with open(path, "rb") as f:
-        data = pickle.load(f)
-    
+        return pickle.load(f)
+
+
+def draw_epoch(ax, l, i):
+    """Draws the scores `l` of epoch `i` as a scatter plot on the axes."""
+    ax.set_xlim(0, len(l))
+    ax.set_ylim(bottom=0, top=max(l) + 100)
+    ax.set_ylabel("Agent score")
+    ax.set_title(f"Epoch {i+1}")
+    ax.scatter(list(range(len(l))), l, 5)
+    ax.plot([len(l) - ceil(len(l) * RANDOM_MIXIN) - 1]*2, [0, 5001], color="orange", label="Random Mixin Threshold")
+    ax.legend(loc="lower left")
+
+
+def display(path, frame_duration, outdir, follow=False):
+    data = load(path)
+
     if frame_duration is None:
-        frame_duration = min(0.5, 10 / len(data))
-    
+        frame_duration = min(0.5, 10 / max(1, len(data)))
+
     if outdir is not None and not os.path.isdir(outdir):
         os.makedirs(outdir)
 
-    for i, l in enumerate(data):
+    i = 0
+    while True:
+        if i == len(data):
+            if not follow:
+                break
+            # wait for the next epoch of a run that is still training
+            plt.pause(1)
+            data = load(path)
+            continue
+
         plt.clf()
-        plt.xlim(0, len(l))
-        plt.ylim(bottom=0, top=max(l) + 100)
-        plt.ylabel("Agent score")
-        plt.title(f"Epoch {i+1}")
-        plt.scatter(list(range(len(l))), l, 5)
-        plt.plot([len(l) - ceil(len(l) * RANDOM_MIXIN) - 1]*2, [0, 5001], color="orange", label="Random Mixin Threshold")
-        plt.legend(loc="lower left")
+        draw_epoch(plt.gca(), data[i], i)
         plt.pause(frame_duration)
         if outdir is not None:
             plt.savefig(os.path.join(outdir, f"epoch_{i}"))
-    
+        i += 1
+
     plt.show()
 
 
+# The data and figure of an export worker process
+_worker_data = None
+_worker_figure = None
+
+
+def _init_export_worker(path):
+    global _worker_data, _worker_figure
+    _worker_data = load(path)
+    _worker_figure = Figure()
+
+
+def _export_epochs(job):
+    """Renders the epochs of one job to PNG files in an export worker."""
+    outdir, epochs = job
+    for i in epochs:
+        _worker_figure.clear()
+        draw_epoch(_worker_figure.add_subplot(), _worker_data[i], i)
+        _worker_figure.savefig(os.path.join(outdir, f"epoch_{i}"))
+    return len(epochs)
+
+
+def export(path, outdir, every=1, jobs=None):
+    """Renders the epochs of a run to PNG files without showing them,
+    spread over a pool of processes. Each process reads the epochs it
+    draws from the file on its own.
+
+    Parameters:
+    - path (str): The stats file or pickle of the run.
+    - outdir (str): The folder the frames are saved in.
+
+    kwargs:
+    - every=1 (int): Only render every this many epochs. The last epoch
+                     is always rendered.
+    - jobs=None (int): The number of processes, one per CPU when None.
+
+    Returns: The number of frames rendered (int)
+    """
+    num_epochs = len(load(path))
+    epochs = list(range(0, num_epochs, every))
+    if epochs and epochs[-1] != num_epochs - 1:
+        epochs.append(num_epochs - 1)
+
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    jobs = jobs or os.cpu_count()
+    # several small batches per process so they finish together
+    batches = [(outdir, batch) for batch in np.array_split(epochs, max(1, min(len(epochs), jobs * 4)))]
+    with multiprocessing.Pool(jobs, initializer=_init_export_worker, initargs=(path,)) as pool:
+        return sum(pool.imap_unordered(_export_epochs, batches))
+
+
+def summarize(path, chunk_size=1024):
+    """Computes the best, mean and percentile scores of every epoch,
+    reading the epochs a chunk at a time.
+
+    Returns: A dict mapping the names of the curves to arrays with one
+             entry per epoch.
+    """
+    data = load(path)
+    curves = {"best": [], "90th percentile": [], "median": [], "mean": [], "10th percentile": []}
+
+    for start in range(0, len(data), chunk_size):
+        chunk = np.asarray(data[start:start + chunk_size])
+        curves["best"].append(chunk.max(axis=1))
+        curves["mean"].append(chunk.mean(axis=1))
+        p10, p50, p90 = np.percentile(chunk, (10, 50, 90), axis=1)
+        curves["10th percentile"].append(p10)
+        curves["median"].append(p50)
+        curves["90th percentile"].append(p90)
+
+    return {name: np.concatenate(parts) if parts else np.zeros(0) for name, parts in curves.items()}
+
+
+def display_summary(path, outdir):
+    """Plots the summary curves of a run over all epochs, saving them to
+    outdir/summary.png when outdir is given and showing them otherwise."""
+    curves = summarize(path)
+    epochs = np.arange(1, len(curves["best"]) + 1)
+
+    fig = plt.figure()
+    ax = fig.add_subplot()
+    for name, values in curves.items():
+        ax.plot(epochs, values, label=name)
+    ax.fill_between(epochs, curves["10th percentile"], curves["90th percentile"], alpha=0.15)
+    ax.set_xlabel("Epoch")
+    ax.set_ylabel("Agent score")
+    ax.set_title("Scores over all epochs")
+    ax.legend(loc="upper left")
+
+    if outdir is not None:
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        fig.savefig(os.path.join(outdir, "summary"))
+    else:
+        plt.show()
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("-i", "--infile", metavar="INPUT_FILEPATH", type=str, default=None, help="Path to pickle file of data")
+    parser.add_argument("-i", "--infile", metavar="INPUT_FILEPATH", type=str, default=None, help="Path to the stats file of a run, or to a pickle file of data")
     parser.add_argument("-f", "--frameduration", metavar="FRAME_DURATION", type=float, default=None, help="Path to pickle file of data")
     parser.add_argument("-o", "--outdir", metavar="DIRECTORY", type=str, default=None, help="Save frames as pngs in the folder specified")
+    parser.add_argument("-F", "--follow", action="store_true", help="Keep showing new epochs as a run that is still training writes them")
+    parser.add_argument("-x", "--export", action="store_true", help="Save the frames to the folder given with -o without showing them, rendering them in parallel")
+    parser.add_argument("-k", "--every", metavar="EPOCHS", type=int, default=1, help="With --export, only render every this many epochs")
+    parser.add_argument("-j", "--jobs", metavar="PROCESSES", type=int, default=None, help="With --export, the number of processes rendering frames (default: one per CPU)")
+    parser.add_argument("-S", "--summary", action="store_true", help="Plot the best, mean and percentile scores over all epochs instead of each epoch. Saved to the folder given with -o, if any")
     args = parser.parse_args()
 
-    if args.infile:
-        display(args.infile, args.frameduration, args.outdir)
+    if not args.infile:
+        return
+
+    if args.summary:
+        display_summary(args.infile, args.outdir)
+    elif args.export:
+        if args.outdir is None:
+            print("[display_stats]: --export needs a folder to save the frames in, given with -o")
+            return
+        if args.every < 1:
+            print("[display_stats]: --every must be at least 1")
+            return
+        count = export(args.infile, args.outdir, every=args.every, jobs=args.jobs)
+        print(f"Saved {count} frames in {args.outdir}")
+    else:
+        display(args.infile, args.frameduration, args.outdir, follow=args.follow)
 
 
 if __name__ == "__main__":
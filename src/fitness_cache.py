@@ -0,0 +1,144 @@
+"""
+fitness_cache.py
+
+Remembers the scores of genomes that were already simulated. Genomes are
+keyed by a hash of their weights and of the settings that affect how they
+score, and every genome keeps running statistics over all of its trials
+so repeated evaluations refine its estimate instead of replacing it.
+
+The cache only averages: every agent is still simulated to the end of its
+episode, and cached scores never shorten or skip an evaluation.
+"""
+
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+
+from body import DEFAULT_SOLVER
+from constants import BASE_FORCE_NOISE, ROD_ACC_NOISE, SUCCESS_THRESHOLD
+
+
+class ScoreStats:
+    """Running statistics of the scores of one genome."""
+
+    __slots__ = ("count", "mean", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.min = None
+        self.max = None
+
+
+    def add(self, score):
+        """Adds the score of one trial."""
+        self.count += 1
+        self.mean += (score - self.mean) / self.count
+        self.min = score if self.min is None else min(self.min, score)
+        self.max = score if self.max is None else max(self.max, score)
+
+
+    def __setstate__(self, state):
+        # caches saved by older versions may hold statistics no longer kept
+        for name, value in state[1].items():
+            if name in self.__slots__:
+                setattr(self, name, value)
+
+
+    def __repr__(self):
+        return f"ScoreStats(count={self.count}, mean={self.mean}, min={self.min}, max={self.max})"
+
+
+class FitnessCache:
+    """A least recently used cache of ScoreStats keyed by genome."""
+
+    def __init__(self, chain_length, capacity=100_000, path=None, delta_t=1/60, solver=DEFAULT_SOLVER,
+                 precision="float64", backend="numpy"):
+        """Creates an empty cache, or loads the one saved at `path`.
+
+        Parameters:
+        - chain_length (int): The chain length of the agents scored.
+
+        kwargs:
+        - capacity=100_000 (int): The number of genomes kept. The least
+                                  recently used ones are dropped first.
+        - path=None (str): The file the cache is saved to by save. Its
+                           entries are loaded if it exists.
+        - delta_t=1/60 (float): The number of seconds in a frame.
+        - solver=DEFAULT_SOLVER (ConstraintSolver): How the sticks of the
+                                agents are kept at their lengths.
+        - precision="float64" (str): The dtype the agents are simulated in.
+        - backend="numpy" (str): The backend that moves the agents.
+
+        Returns: None
+        """
+        self.capacity = capacity
+        self.path = path
+        self.entries = OrderedDict()
+
+        # Scores are only comparable between runs with the same settings
+        config = (chain_length, delta_t, BASE_FORCE_NOISE, ROD_ACC_NOISE, SUCCESS_THRESHOLD)
+        settings = (solver.iterations, solver.tolerance, solver.method)
+        if settings != (DEFAULT_SOLVER.iterations, DEFAULT_SOLVER.tolerance, DEFAULT_SOLVER.method):
+            # left out for the default so older caches stay valid
+            config += settings
+        if (precision, backend) != ("float64", "numpy"):
+            config += (precision, backend)
+        self.__config = repr(config).encode()
+
+        if path is not None and os.path.exists(path):
+            with open(path, "rb") as f:
+                self.entries.update(pickle.load(f))
+            self.__evict()
+
+
+    def key(self, genome):
+        """Returns the key (bytes) of a genome under the cache's settings."""
+        digest = hashlib.blake2b(self.__config, digest_size=16)
+        digest.update(np.ascontiguousarray(genome, dtype=float).tobytes())
+        return digest.digest()
+
+
+    def record(self, genome, score):
+        """Adds the score of one trial of a genome.
+
+        Parameters:
+        - genome (ndarray): The genome that was scored.
+        - score (int): The score of the trial.
+
+        Returns: The updated ScoreStats of the genome.
+        """
+        key = self.key(genome)
+        stats = self.entries.get(key)
+        if stats is None:
+            stats = self.entries[key] = ScoreStats()
+        else:
+            self.entries.move_to_end(key)
+
+        stats.add(score)
+        self.__evict()
+        return stats
+
+
+    def __evict(self):
+        """Drops the least recently used entries over capacity."""
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def save(self):
+        """Writes the cache to its path, if it has one."""
+        if self.path is None:
+            return
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,374 @@
+"""
+kernels.py
+
+Optional compiled kernels for the physics of a PopulationBody. With short
+chains every NumPy operation of a frame works on a handful of numbers per
+agent, so the frame is dominated by the overhead of the operations and of
+gathering the live agents' rows. These kernels instead loop over the live
+agents and update their points in place, and are compiled with Numba when
+it is installed. Numba is only imported, and the kernels compiled, once
+the "numba" backend is requested, so NumPy runs do not pay for it.
+
+The "numpy" backend is the reference implementation in PopulationBody.
+The "numba" backend falls back to it when Numba is not installed.
+
+run_episode runs a whole episode of one agent, its net included, in one
+compiled loop. It backs the EpisodeEvaluator and has no NumPy fallback,
+as one agent at a time is far slower than the population in NumPy.
+"""
+
+import math
+
+import numpy as np
+
+from activations import tanh, relu, sigmoid
+
+# Numba once the numba backend was requested and it is installed
+numba = None
+_numba_checked = False
+
+# The kernels compiled with Numba
+COMPILED = ("stick_error", "relax_sticks", "solve_chain", "move_row", "move_rows", "max_stick_error",
+            "activate", "net_effort", "run_episode")
+
+
+BACKENDS = ("numpy", "numba")
+
+# The activation functions the compiled nets can compute, by code
+ACTIVATIONS = (tanh, relu, sigmoid)
+
+
+def resolve_backend(backend):
+    """Returns the backend that will actually run for a requested one:
+    "numba" only if Numba is installed, "numpy" otherwise."""
+    if backend not in BACKENDS:
+        raise Exception(f"unknown backend {backend}, expected one of {BACKENDS}")
+    if backend == "numba" and not _load_numba():
+        return "numpy"
+    return backend
+
+
+def _load_numba():
+    """Imports Numba and compiles the kernels with it the first time it
+    is called. Returns True if Numba is installed."""
+    global numba, _numba_checked
+    if not _numba_checked:
+        _numba_checked = True
+        try:
+            import numba
+        except ImportError:
+            return False
+
+        # fastmath stays off so the compiled kernels round like NumPy does
+        module = globals()
+        for name in COMPILED:
+            module[name] = numba.njit(cache=True)(module[name])
+    return numba is not None
+
+
+def stick_arrays(sticks, num_points, locked_points):
+    """Returns the sticks (p1, p2, distance) of a skeleton as the columns
+    (stick_a, stick_b, stick_len) the kernels take, followed by an array
+    that is True for each of its `num_points` points that is locked."""
+    stick_a = np.array([s[0] for s in sticks], dtype=np.int64)
+    stick_b = np.array([s[1] for s in sticks], dtype=np.int64)
+    stick_len = np.array([s[2] for s in sticks], dtype=float)
+    locked = np.isin(np.arange(num_points), locked_points)
+    return stick_a, stick_b, stick_len, locked
+
+
+def activation_codes(activations):
+    """Returns the codes of the activation functions of a net's layers
+    for net_effort.
+
+    Parameters:
+    - activations [function]: The activation function of each layer
+                              after the input layer.
+
+    Returns: An ndarray of codes into ACTIVATIONS.
+    """
+    codes = []
+    for act_f in activations:
+        if act_f not in ACTIVATIONS:
+            raise Exception(f"the compiled nets cannot compute the activation function {act_f.__name__}")
+        codes.append(ACTIVATIONS.index(act_f))
+    return np.array(codes, dtype=np.int64)
+
+
+def stick_error(points, row, stick_a, stick_b, stick_len):
+    """Returns the largest relative stick length error of one agent."""
+    error = 0.0
+    for s in range(len(stick_len)):
+        dx = points[row, stick_b[s], 0] - points[row, stick_a[s], 0]
+        dy = points[row, stick_b[s], 1] - points[row, stick_a[s], 1]
+        error = max(error, abs(math.sqrt(dx*dx + dy*dy) - stick_len[s]) / stick_len[s])
+    return error
+
+
+def relax_sticks(points, row, stick_a, stick_b, stick_len, locked, iterations, tolerance):
+    """Relaxes the sticks of one agent's points in place, in the same
+    order and with the same arithmetic as the NumPy implementation.
+    With a tolerance of 0 or more, stops early once the agent's stick
+    error is within it.
+
+    Returns: The number of passes run (int)
+    """
+    passes = 0
+    while passes < iterations:
+        if tolerance >= 0 and stick_error(points, row, stick_a, stick_b, stick_len) <= tolerance:
+            break
+        passes += 1
+
+        for s in range(len(stick_len)):
+            a = stick_a[s]
+            b = stick_b[s]
+            dx = points[row, b, 0] - points[row, a, 0]
+            dy = points[row, b, 1] - points[row, a, 1]
+            len_delta = math.sqrt(dx*dx + dy*dy)
+            diff = (len_delta - stick_len[s]) / len_delta
+
+            cx = dx*0.5*diff
+            cy = dy*0.5*diff
+            if not locked[a]:
+                points[row, a, 0] += cx
+                points[row, a, 1] += cy
+            if not locked[b]:
+                points[row, b, 0] -= cx
+                points[row, b, 1] -= cy
+
+    return passes
+
+
+def solve_chain(points, row, stick_a, stick_b, stick_len, locked, iterations, tolerance, scratch):
+    """Solves the stick constraints of one agent's chain in place with
+    the direct solver of chain_solver.py, with the same arithmetic.
+    With a tolerance of 0 or more, stops early once the agent's stick
+    error is within it.
+
+    Parameters:
+    - scratch (ndarray): A (6, S) array of work space.
+
+    Returns: The number of passes run (int)
+    """
+    num_sticks = len(stick_len)
+    normal_x, normal_y, error, off, upper, multipliers = scratch
+
+    passes = 0
+    while passes < iterations:
+        if tolerance >= 0 and stick_error(points, row, stick_a, stick_b, stick_len) <= tolerance:
+            break
+        passes += 1
+
+        for s in range(num_sticks):
+            dx = points[row, s + 1, 0] - points[row, s, 0]
+            dy = points[row, s + 1, 1] - points[row, s, 1]
+            length = math.sqrt(dx*dx + dy*dy)
+            normal_x[s] = dx / length
+            normal_y[s] = dy / length
+            error[s] = length - stick_len[s]
+
+        for s in range(num_sticks - 1):
+            w = 0.0 if locked[s + 1] else 1.0
+            off[s] = -w * (normal_x[s]*normal_x[s + 1] + normal_y[s]*normal_y[s + 1])
+
+        diag0 = (0.0 if locked[0] else 1.0) + (0.0 if locked[1] else 1.0)
+        multipliers[0] = error[0] / diag0
+        if num_sticks > 1:
+            upper[0] = off[0] / diag0
+        for s in range(1, num_sticks):
+            diag = (0.0 if locked[s] else 1.0) + (0.0 if locked[s + 1] else 1.0)
+            denom = diag - off[s - 1]*upper[s - 1]
+            if s < num_sticks - 1:
+                upper[s] = off[s] / denom
+            multipliers[s] = (error[s] - off[s - 1]*multipliers[s - 1]) / denom
+        for s in range(num_sticks - 2, -1, -1):
+            multipliers[s] -= upper[s]*multipliers[s + 1]
+
+        for s in range(num_sticks):
+            if not locked[s]:
+                points[row, s, 0] += multipliers[s]*normal_x[s]
+                points[row, s, 1] += multipliers[s]*normal_y[s]
+        for s in range(num_sticks):
+            if not locked[s + 1]:
+                points[row, s + 1, 0] -= multipliers[s]*normal_x[s]
+                points[row, s + 1, 1] -= multipliers[s]*normal_y[s]
+
+    return passes
+
+
+def move_row(points, old_points, row, acc_noise, delta_t, stick_a, stick_b, stick_len, locked, iterations, tolerance, chain, scratch):
+    """Verlet integration step of the free points of one agent followed
+    by the stick relaxation, in place.
+
+    Parameters:
+    - acc_noise (ndarray): The noise added to the acceleration of each
+                           free point of the agent.
+    - scratch (ndarray): A (6, S) array of work space for the chain solver.
+
+    See move_rows for the other parameters.
+
+    Returns: The number of passes run (int)
+    """
+    dt2 = delta_t**2
+    free = 0
+    for p in range(points.shape[1]):
+        if locked[p]:
+            continue
+        noise = acc_noise[free]
+        free += 1
+
+        x = points[row, p, 0]
+        y = points[row, p, 1]
+        points[row, p, 0] = x + ((x - old_points[row, p, 0])*0.999 + noise*dt2)
+        points[row, p, 1] = y + ((y - old_points[row, p, 1])*0.999 + (100 + noise)*dt2)
+        old_points[row, p, 0] = x
+        old_points[row, p, 1] = y
+
+    if chain:
+        return solve_chain(points, row, stick_a, stick_b, stick_len, locked, iterations, tolerance, scratch)
+    return relax_sticks(points, row, stick_a, stick_b, stick_len, locked, iterations, tolerance)
+
+
+def move_rows(points, old_points, rows, acc_noise, delta_t, stick_a, stick_b, stick_len, locked, iterations, tolerance, chain):
+    """Verlet integration step of the free points of the given agents
+    followed by the stick relaxation, in place.
+
+    Parameters:
+    - points, old_points (ndarray): The (N, P, 2) point arrays.
+    - rows (ndarray): Indices of the agents to move.
+    - acc_noise (ndarray): An (M, P - 1) array with the noise added to
+                           the acceleration of each free point.
+    - delta_t (float): The amount of time to step forward.
+    - stick_a, stick_b, stick_len (ndarray): The sticks as columns.
+    - locked (ndarray): True for each locked point.
+    - iterations (int): The most relaxation passes per agent.
+    - tolerance (float): The relative stick error to stop relaxing at,
+                         or a negative number to always run every pass.
+    - chain (bool): Use the direct chain solver instead of relaxing.
+
+    Returns: The number of passes run over all agents (int)
+    """
+    passes = 0
+    scratch = np.empty((6, len(stick_len)))
+    for i in range(len(rows)):
+        passes += move_row(points, old_points, rows[i], acc_noise[i], delta_t, stick_a, stick_b, stick_len, locked,
+                           iterations, tolerance, chain, scratch)
+    return passes
+
+
+def max_stick_error(points, rows, stick_a, stick_b, stick_len):
+    """Returns the largest relative stick length error of the given
+    agents."""
+    error = 0.0
+    for i in range(len(rows)):
+        error = max(error, stick_error(points, rows[i], stick_a, stick_b, stick_len))
+    return error
+
+
+def activate(x, code):
+    """Returns the activation function with the given code at x."""
+    if code == 0:
+        return math.tanh(x)
+    if code == 1:
+        return max(0.0, x)
+    return 1/(1 + math.exp(-x))
+
+
+def net_effort(genome, shapes, codes, acts, work):
+    """Runs the forward pass of a net kept in a genome vector, laid out
+    like NeuralNet.genome, and returns its first output.
+
+    Parameters:
+    - genome (ndarray): The weights of the net.
+    - shapes (ndarray): An (L, 2) array with the (out, in) shape of each
+                        weight layer.
+    - codes (ndarray): The activation code of each layer.
+    - acts (ndarray): Holds the input vector, overwritten by the layers.
+    - work (ndarray): Work space at least as long as the widest layer.
+
+    Returns: The first output of the net (float)
+    """
+    offset = 0
+    for layer in range(len(shapes)):
+        rows = shapes[layer, 0]
+        cols = shapes[layer, 1]
+        for r in range(rows):
+            total = 0.0
+            for c in range(cols):
+                total += genome[offset + r*cols + c] * acts[c]
+            work[r] = activate(total, codes[layer])
+        for r in range(rows):
+            acts[r] = work[r]
+        offset += rows*cols
+    return acts[0]
+
+
+def run_episode(row, start, stop, delta_t, move_strength, track_width, threshold, genomes, shapes, codes,
+                force_noise, rod_noise, points, old_points, base_pos, base_vel, stick_a, stick_b, stick_len, locked,
+                iterations, tolerance, chain, frames_alive, total_dist, last_pos, running, history, history_start,
+                acts, work, scratch):
+    """Runs the episode of one agent from frame `start` to frame `stop`
+    of its current block of noise, or until it is done, in place. Every
+    frame does what a frame of Population.step does for the agent: the
+    forward pass of its net, the force on its base, the move of its
+    points and the update of its score.
+
+    Parameters:
+    - row (int): The agent's index.
+    - start, stop (int): The range of noise frames to run.
+    - delta_t (float): The number of seconds in a frame.
+    - move_strength (float): How strong the force on the base is.
+    - track_width (float): The width of the track the base moves on.
+    - threshold (int): The agent is done once its score exceeds it.
+    - genomes (ndarray): The (N, G) genome matrix.
+    - shapes, codes (ndarray): The layers of the nets, see net_effort.
+    - force_noise (ndarray): The agent's force noise of each frame.
+    - rod_noise (ndarray): The agent's (frames, P - 1) point noise.
+    - points, old_points, base_pos, base_vel (ndarray): The bodies.
+    - stick_a ... chain: The constraint solver, see move_rows.
+    - frames_alive, total_dist, last_pos, running (ndarray): The scores,
+            kept like in a PopulationScorer.
+    - history (ndarray): An (N, H) array receiving the agent's travelled
+            distance after frames history_start + 1 to history_start + H.
+    - history_start (int): The first frame of the history record.
+    - acts, work (ndarray): Work space of the net, see net_effort.
+    - scratch (ndarray): Work space of the chain solver.
+
+    Returns: (the noise frame it stopped at, the number of constraint
+              passes run)
+    """
+    num_points = points.shape[1]
+    passes = 0
+    for i in range(start, stop):
+        # the net input of Agent.net_input
+        acts[0] = base_vel[row]
+        acts[1] = base_pos[row]
+        for p in range(num_points - 1):
+            acts[p + 2] = points[row, p + 1, 0] - points[row, p, 0]
+        move_force = math.tanh(net_effort(genomes[row], shapes, codes, acts, work))
+
+        vel = base_vel[row] + (move_force + force_noise[i]) * move_strength * delta_t
+        pos = min(max(base_pos[row] + vel, -track_width / 2), track_width / 2)
+        base_vel[row] = vel
+        base_pos[row] = pos
+        points[row, 0, 0] = pos
+        points[row, 0, 1] = 0.0
+
+        passes += move_row(points, old_points, row, rod_noise[i], delta_t, stick_a, stick_b, stick_len, locked,
+                           iterations, tolerance, chain, scratch)
+
+        # the first update only records the position
+        frames_alive[row] += 1
+        if frames_alive[row] > 1:
+            total_dist[row] += int(abs(pos - last_pos[row]))
+        last_pos[row] = pos
+
+        column = frames_alive[row] - history_start - 1
+        if 0 <= column < history.shape[1]:
+            history[row, column] = total_dist[row]
+
+        if points[row, 1, 1] - points[row, 0, 1] >= 0 or frames_alive[row] - total_dist[row] > threshold:
+            running[row] = False
+            return i + 1, passes
+
+    return stop, passes
@@ -5,40 +5,86 @@ This class is used to create an instance of the simulation.
 """
 
 import argparse
-import pickle
 import os
+import time
 
-import pygame
-from pygame.locals import *
 from constants import RANDOM_MIXIN, SCREEN_BACKGROUND_COLOR, SUCCESS_THRESHOLD, MUTATION_DECAY
-import environment
-import graphics
 import agent
 import sys
+import numpy as np
 from neural_net import NeuralNet
+from population import Population
+from population_net import PopulationNet
+from noise import episode_seed
+from checkpoint import save_checkpoint, load_checkpoint
+from fitness_cache import FitnessCache
+from body import ConstraintSolver, DEFAULT_SOLVER
+import kernels
+from profiler import PhaseProfiler, NULL_PROFILER
+from stats_file import StatsWriter
 
-
-pygame.init()
+# pygame and the rendering modules (graphics, environment) are imported
+# only when graphics are enabled, so headless training needs NumPy alone.
 
 
 class Simulation:
     """Creates a simulated environment containing ANN controlled agents."""
 
-    def __init__(self, num_agents, do_graphics=True, num_reproducing=1, epochs=10, chain_length=0, **kwargs):
+    def __init__(self, num_agents, do_graphics=True, num_reproducing=1, epochs=10, chain_length=0, workers=1, episodes=False, seed=None, checkpoint_every=10, resume=None, fitness_cache=None, halving_horizons=None, halving_keep=None, trials=1, select="mean", precision="float64", backend="numpy", profile=False, render_every=1, render_fps=None, max_drawn=None, solver=DEFAULT_SOLVER, **kwargs):
         """Default constuctor."""
+        # Every episode's noise is derived from the seed of the run. A
+        # given seed also fixes the nets, so the run can be reproduced.
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        else:
+            np.random.seed(seed)
+        self.seed = seed
+
         self.do_graphics = do_graphics
         self.num_agents = num_agents
         self.num_reproducing = num_reproducing
         self.chain_length = chain_length
+        self.workers = workers
+        # floating point type of the batched physics and nets
+        self.dtype = np.dtype(precision)
+        # kernels of the batched physics, see kernels.py
+        self.backend = backend
+        # how the sticks of the skeletons are kept at their lengths
+        self.solver = solver
+        # times the phases of each generation when profiling
+        self.profiler = PhaseProfiler() if profile else NULL_PROFILER
+        # With graphics, the agents are drawn at most every render_every
+        # simulated frames and at most render_fps times per second, so
+        # the simulation is not held back by drawing
+        self.render_every = render_every
+        self.render_interval = 1 / render_fps if render_fps else 0
         self.savename = "best_network.net"
 
         if do_graphics:
+            import pygame
+            import environment
+            import graphics
+            from renderer import AgentRenderer
+
             # Initialize the graphics
+            pygame.init()
             self.screen = graphics.Graphics()
             self.environment = environment.Environment()
+            # draws at most max_drawn of the agents
+            self.renderer = AgentRenderer(max_drawn)
 
         # create list of agents
-        self.agents = [agent.Agent(chain_length=self.chain_length) for _ in range(num_agents)]
+        self.agents = [agent.Agent(chain_length=self.chain_length, solver=self.solver) for _ in range(num_agents)]
+
+        # The nets of the agents keep their weights in the rows of one
+        # (num_agents, genome size) matrix, so a generation is bred with
+        # array operations on it
+        net = self.agents[0].net
+        self.net_shapes = [w.shape for w in net.weights]
+        self.genomes = np.empty((num_agents, net.genome().size))
+        for a, genome in zip(self.agents, self.genomes):
+            a.net.use_genome(genome)
+        self.color_rng = np.random.default_rng()
 
         # Set the active agent
         self.active_agent = 0
@@ -53,15 +99,55 @@ class Simulation:
             # presses s. Then print a network saved message
             self.savename = kwargs.get("savefile")
 
-        self.mutation_amount = 0.1 # standard deviation in gaussian noise
+        # The state of the run is saved every checkpoint_every generations
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_path = resume if resume is not None else f"{self.savename}_checkpoint.npz"
 
         self.epochs = epochs
         self.epochs_elapsed = 0
 
+        self.start_generation()
+
+        # Headless generations can be split across worker processes, run
+        # as one episode per agent instead of in lockstep or cut down by
+        # successive halving
+        self.evaluator = None
+        self.trials = trials
+        self.select = select
+        self.halving_horizons = halving_horizons
+        self.halving_keep = halving_keep
+        if trials > 1 and not do_graphics:
+            from scheduler import TrialEvaluator
+            self.evaluator = TrialEvaluator(
+                num_reproducing, chain_length, self.net_shapes, self.agents[0].net.activations[1:], trials,
+                dtype=self.dtype, backend=self.backend, solver=self.solver, profiler=self.profiler,
+            )
+        elif halving_horizons and not do_graphics:
+            from scheduler import SuccessiveHalvingEvaluator
+            # a single keep fraction is used for every horizon
+            if len(halving_keep) == 1:
+                halving_keep = halving_keep * len(halving_horizons)
+            self.evaluator = SuccessiveHalvingEvaluator(
+                num_reproducing, chain_length, self.net_shapes, self.agents[0].net.activations[1:],
+                halving_horizons, halving_keep, dtype=self.dtype, backend=self.backend, solver=self.solver, profiler=self.profiler,
+            )
+        elif self.workers > 1 and not do_graphics:
+            from parallel import ShardedEvaluator
+            self.evaluator = ShardedEvaluator(
+                self.workers, num_agents, num_reproducing, chain_length,
+                self.net_shapes, self.agents[0].net.activations[1:], dtype=self.dtype, backend=self.backend,
+                solver=self.solver, profiler=self.profiler,
+            )
+        elif episodes and not do_graphics:
+            from scheduler import EpisodeEvaluator
+            self.evaluator = EpisodeEvaluator(num_reproducing, chain_length, self.net_shapes, self.agents[0].net.activations[1:],
+                                              solver=self.solver, profiler=self.profiler)
+
+        self.mutation_amount = 0.1 # standard deviation in gaussian noise
+
         self.best_agent = None
         self.best_score = -10000000
 
-        self.score_lists = [] # list of lists of scores for each agent on each epoch
 
         if do_graphics:
             self.font = pygame.font.SysFont("Arial, Times New Roman", 32)
@@ -76,6 +162,20 @@ class Simulation:
 
         self.stop_early = True
 
+        # Optional FitnessCache of the scores of finished episodes. Agents
+        # are ranked on the mean over every trial their genome had, and
+        # the parents are carried over unmutated to get more trials.
+        self.fitness_cache = fitness_cache
+
+        if resume is not None:
+            self.restore_checkpoint(resume)
+
+        # The scores of every generation are appended to a stats file as
+        # the generation ends. A resumed run drops the generations after
+        # its checkpoint.
+        self.name_with_params = f"{self.savename}_{self.num_agents}a_{self.num_reproducing}r_{self.epochs}e_{SUCCESS_THRESHOLD}"
+        self.stats = StatsWriter(f"{self.name_with_params}_stats.bin", num_agents, trials=trials, generations=self.epochs_elapsed)
+
     def showcase_loop(self, path):
         """Loads the simulation in a display mode for showcaseing a loaded network."""
 
@@ -85,7 +185,7 @@ class Simulation:
                 try:
                     net = NeuralNet.net_from_file(os.path.join(path, item))
                     net_input_len = net.input_size
-                    a = agent.Agent(net_input_len - 3)
+                    a = agent.Agent(net_input_len - 3, solver=self.solver)
                     a.net = net
                     self.agents.append(a)
                 except:
@@ -97,12 +197,17 @@ class Simulation:
 
             # Create an agent with a chain matching the network's input size
             net_input_len = display_net.input_size
-            display_agent = agent.Agent(net_input_len-3)
+            display_agent = agent.Agent(net_input_len-3, solver=self.solver)
             display_agent.net = display_net
 
             self.agents = [display_agent]
         
         self.set_active_agent(0)
+
+        if self.do_graphics:
+            import pygame
+            from pygame.locals import QUIT, KEYDOWN, K_ESCAPE, K_LEFT, K_RIGHT, K_r
+            import graphics
         
         # Enter the main loop
         while True:
@@ -132,6 +237,10 @@ class Simulation:
             if alive_agent_count == 1:
                 self.unhighlight_all()
 
+            # the lone survivor's net is drawn below
+            for a in self.agents:
+                a.net_visible = alive_agent_count == 1
+
             # update agent
             [a.update(1/60, stop_at_threshold=False) for a in self.agents]
 
@@ -140,7 +249,9 @@ class Simulation:
                 self.environment.draw(self.screen)
 
                 # draw agents
-                [a.draw(self.screen) for a in self.agents if not a.scorer.is_done()]
+                rows = np.array([i for i, a in enumerate(self.agents) if not a.scorer.is_done()], dtype=int)
+                rows = self.renderer.visible(rows, len(self.agents), self.active_agent)
+                self.renderer.draw_agents(self.screen, [self.agents[i] for i in rows])
                 if alive_agent_count == 1:
                     [a.net.draw(self.screen) for a in self.agents if not a.scorer.is_done()]
                 if self.agents[self.active_agent].scorer.is_done():
@@ -183,6 +294,94 @@ class Simulation:
         self.agents[idx].is_highlighted = True
 
 
+    def episode_seeds(self):
+        """Returns the noise seed of each agent's episode in the current
+        generation."""
+        return [episode_seed(self.seed, self.epochs_elapsed, row) for row, _ in enumerate(self.agents)]
+
+
+    def start_generation(self):
+        """Builds the batched nets, bodies and scores that back the
+        current agents during a generation."""
+        genomes = self.genomes.astype(self.dtype, copy=False)
+        population_net = PopulationNet.from_genomes(genomes, self.net_shapes, self.agents[0].net.activations[1:])
+        self.population = Population(population_net, self.chain_length, seeds=self.episode_seeds(), backend=self.backend, solver=self.solver,
+                                     profiler=self.profiler)
+
+        for row, a in enumerate(self.agents):
+            a.bind(self.population.body, self.population.scorer, row)
+
+
+    def save_checkpoint(self):
+        """Saves everything needed to continue the run from the start of
+        the current generation to self.checkpoint_path."""
+        rng_state = np.random.get_state()
+        best_genome = self.best_agent.net.genome() if self.best_agent is not None else np.zeros(0)
+
+        save_checkpoint(
+            self.checkpoint_path,
+            num_agents=self.num_agents,
+            num_reproducing=self.num_reproducing,
+            chain_length=self.chain_length,
+            epochs=self.epochs,
+            savename=self.savename,
+            seed=str(self.seed),
+            epochs_elapsed=self.epochs_elapsed,
+            mutation_amount=self.mutation_amount,
+            genomes=self.genomes,
+            base_colors=np.array([a.base_color for a in self.agents]),
+            rod_colors=np.array([a.rod_color for a in self.agents]),
+            best_genome=best_genome,
+            best_score=self.best_score,
+            rng_keys=rng_state[1],
+            rng_pos=rng_state[2],
+            rng_has_gauss=rng_state[3],
+            rng_cached_gaussian=rng_state[4],
+            # the options that change the course of the run
+            precision=self.dtype.name,
+            backend=self.backend,
+            constraint_solver=self.solver.method,
+            constraint_iterations=self.solver.iterations,
+            constraint_tolerance=np.nan if self.solver.tolerance is None else self.solver.tolerance,
+            trials=self.trials,
+            select=self.select,
+            halving_horizons=np.array(self.halving_horizons or [], dtype=int),
+            halving_keep=np.array(self.halving_keep or [], dtype=float),
+            fitness_cache=(self.fitness_cache.path or "") if self.fitness_cache is not None else "",
+        )
+
+
+    def restore_checkpoint(self, path):
+        """Continues the run saved in the checkpoint at `path` from the
+        start of the generation it was saved at."""
+        state = load_checkpoint(path)
+
+        self.seed = int(state["seed"])
+        self.epochs_elapsed = int(state["epochs_elapsed"])
+        self.mutation_amount = float(state["mutation_amount"])
+
+        self.genomes[:] = state["genomes"]
+        for a, base_color, rod_color in zip(self.agents, state["base_colors"], state["rod_colors"]):
+            a.base_color = tuple(int(c) for c in base_color)
+            a.rod_color = tuple(int(c) for c in rod_color)
+
+        if len(state["best_genome"]):
+            self.best_agent = agent.Agent(chain_length=self.chain_length, solver=self.solver)
+            self.best_agent.net.set_genome(state["best_genome"])
+            self.best_score = int(state["best_score"])
+
+        np.random.set_state(("MT19937", state["rng_keys"], int(state["rng_pos"]),
+                             int(state["rng_has_gauss"]), float(state["rng_cached_gaussian"])))
+
+        self.start_generation()
+        self.set_active_agent(0)
+
+        if self.do_graphics:
+            self.epoch_text = self.font.render(f"Epoch {self.epochs_elapsed + 1}", True, (0, 0, 0), SCREEN_BACKGROUND_COLOR)
+
+        print(f"Resuming from {path} at generation {self.epochs_elapsed + 1}/{self.epochs}")
+
+
     def increment_epoch(self):
         """ returns True if the final epoch has elapsed """
         self.mutation_amount *= MUTATION_DECAY
@@ -194,95 +393,280 @@ class Simulation:
     def run(self):
         """Runs the program."""
 
-        # Function for detecting if a key is pressed down
         if self.do_graphics:
+            import pygame
+            from pygame.locals import QUIT, KEYDOWN, K_ESCAPE, K_LEFT, K_RIGHT, K_SPACE, K_p, K_s, K_n
+            import graphics
+
+            # Function for detecting if a key is pressed down
             pressed =  pygame.key.get_pressed()
 
-        while True:
-            if self.do_graphics:
-                for event in pygame.event.get():
-                    if event.type == QUIT:
-                        return
-                    elif event.type == KEYDOWN:
-                        if event.key == K_ESCAPE:
-                            pygame.quit()
-                            return
-                        if event.key == K_LEFT:
-                            self.increment_active_agent(-1)
-                        if event.key == K_RIGHT:
-                            self.increment_active_agent(1)
-                        if event.key == K_SPACE:
-                            self.stop_early = not self.stop_early
-                        
-                        if event.key == K_p:
-                            print(self.agents[self.active_agent].nn_weights_string())
-
-                        if event.key == K_s:
-                            print(self.agents[self.active_agent].scorer.get_score())
-
-                        if event.key == K_n:
-                            print(f"Saved the network \`{self.savename}\`")
-                            self.agents[self.active_agent].save_network(self.savename)
-                            sys.exit()
+        self.profiler.reset()
+        frame = 0
+        next_render = time.perf_counter()
+        try:
+            while True:
+                # on last epoch, don't stop early
+                if self.epochs_elapsed == self.epochs - 1:
+                    self.stop_early = False
+
+                if self.evaluator is not None:
+                    # The evaluator simulates the whole generation at once
+                    scores, complete = self.evaluator.evaluate(self.agents, self.stop_early, self.episode_seeds())
+                    # multi-trial scores are ranked on the selected statistic
+                    order, statistics = None, None
+                    if self.trials > 1:
+                        order = self.evaluator.order(self.select)
+                        statistics = self.evaluator.statistics
+                    if self.end_generation(scores, complete, order, statistics):
+                        break
+                    continue
 
-            # update agents
-            [a.update(1/60) for a in self.agents]
+                if self.do_graphics:
+                    with self.profiler.phase("events"):
+                        for event in pygame.event.get():
+                            if event.type == QUIT:
+                                return
+                            elif event.type == KEYDOWN:
+                                if event.key == K_ESCAPE:
+                                    pygame.quit()
+                                    return
+                                if event.key == K_LEFT:
+                                    self.increment_active_agent(-1)
+                                if event.key == K_RIGHT:
+                                    self.increment_active_agent(1)
+                                if event.key == K_SPACE:
+                                    self.stop_early = not self.stop_early
+                            
+                                if event.key == K_p:
+                                    print(self.agents[self.active_agent].nn_weights_string())
+
+                                if event.key == K_s:
+                                    print(self.agents[self.active_agent].scorer.get_score())
+
+                                if event.key == K_n:
+                                    print(f"Saved the network \`{self.savename}\`")
+                                    self.agents[self.active_agent].save_network(self.savename)
+                                    sys.exit()
+
+                # Draw this frame if it is due both by count and by time.
+                # Events are handled on every frame regardless.
+                render = False
+                if self.do_graphics:
+                    frame += 1
+                    if frame >= self.render_every:
+                        now = time.perf_counter()
+                        if now >= next_render:
+                            render = True
+                            frame = 0
+                            next_render = max(next_render + self.render_interval, now)
+
+                if render and self.population.scorer.running[self.active_agent]:
+                    # The highlighted agent's net is drawn, so let it
+                    # record its node activations
+                    with self.profiler.phase("drawing"):
+                        net_input = self.population.body.net_inputs([self.active_agent])[0]
+                        self.agents[self.active_agent].net.evaluate(net_input)
+
+                # advance all live agents in one batched pass
+                self.population.step(1/60)
+
+                if self.do_graphics and self.agents[self.active_agent].scorer.is_done():
+                    self.increment_active_agent(1)
 
-            if self.do_graphics:
-                # Draw the environment again
-                self.environment.draw(self.screen)
+                if render:
+                    with self.profiler.phase("drawing"):
+                        # Draw the environment again
+                        self.environment.draw(self.screen)
 
-                # draw agents
-                [a.draw(self.screen) for a in self.agents if not a.scorer.is_done()]
-                if self.agents[self.active_agent].scorer.is_done():
-                    self.increment_active_agent(1)
+                        # draw the live agents
+                        rows = self.renderer.visible(self.population.alive, self.num_agents, self.active_agent)
+                        self.renderer.draw(self.screen, [self.agents[i] for i in rows],
+                                           self.population.body.points[rows], self.population.body.sticks)
 
-                # stop early indicator
-                self.screen.blit(self.text, self.text_rect)
-                self.screen.blit(self.epoch_text, self.epoch_text_rect)
-                pygame.draw.rect(self.screen, (0, 255, 0) if self.stop_early else (50, 50, 50), (self.text_rect.right + 10, self.text_rect.top + 5, 30, 30))
-                
-                graphics.Graphics.update()
-            
-            # on last epoch, don't stop early
-            if self.epochs_elapsed == self.epochs - 1:
-                self.stop_early = False
-
-            # if all the agents are done, prepare next generation
-            agents_are_done = [a.scorer.is_done() for a in self.agents]
-            if all(agents_are_done) or (self.stop_early and agents_are_done.count(False) <= self.num_reproducing):
-                # get the best agents
-                self.agents.sort(key=lambda x: -x.scorer.get_score())
-                best_agents = self.agents[:self.num_reproducing]
-                print(f"\nGen {self.epochs_elapsed + 1}/{self.epochs}")
-                print("Best scores:", [a.scorer.get_score() for a in best_agents])
-                scores = [a.scorer.get_score() for a in self.agents]
-                print("Last index of max score:", max(i for i, s in enumerate(scores) if s == self.agents[0].scorer.get_score()))
-                print("Average:", sum(scores) / len(scores))
-
-                self.score_lists.append([a.scorer.get_score() for a in self.agents])
-
-                if not self.stop_early:
-                    # >= so later successful nets are favored over earlier ones 
-                    if best_agents[0].scorer.get_score() >= self.best_score:
-                        self.best_score = best_agents[0].scorer.get_score()
-                        self.best_agent = best_agents[0]
+                        # stop early indicator
+                        self.screen.blit(self.text, self.text_rect)
+                        self.screen.blit(self.epoch_text, self.epoch_text_rect)
+                        pygame.draw.rect(self.screen, (0, 255, 0) if self.stop_early else (50, 50, 50), (self.text_rect.right + 10, self.text_rect.top + 5, 30, 30))
                     
-                # best agents reproduce
-                self.agents = [best_agents[i % len(best_agents)].mutated_copy(self.mutation_amount) for i in range(self.num_agents - round(self.num_agents * RANDOM_MIXIN))]
-                self.agents += [agent.Agent(chain_length=self.chain_length) for _ in range(round(self.num_agents * RANDOM_MIXIN))]
-
-                self.set_active_agent(0)
+                        graphics.Graphics.update()
+
+                # if all the agents are done, prepare next generation
+                alive_count = len(self.population.alive)
+                if alive_count == 0 or (self.stop_early and alive_count <= self.num_reproducing):
+                    if self.end_generation(self.population.scorer.get_scores(), ~self.population.scorer.running):
+                        break
+        except KeyboardInterrupt:
+            if self.checkpoint_every > 0 and self.epochs_elapsed >= self.checkpoint_every:
+                print(f"\nInterrupted, continue with --resume {self.checkpoint_path}")
+            raise
+        finally:
+            if self.evaluator is not None:
+                self.evaluator.close()
+            self.stats.close()
+
+
+    def breed(self, parents):
+        """Replaces the genomes of the agents with the next generation's.
+        The parents are tiled over the first rows and mutated, and the
+        remaining RANDOM_MIXIN share of the rows gets random genomes.
+        With a fitness cache, the first copy of each parent is kept
+        unmutated so its next episode refines the parent's mean score.
+
+        Parameters:
+        - parents (ndarray): The rows of the agents that reproduce.
+
+        Returns: None
+        """
+        num_children = self.num_agents - round(self.num_agents * RANDOM_MIXIN)
+        num_elites = min(len(parents), num_children) if self.fitness_cache is not None else 0
+        genome_size = self.genomes.shape[1]
+
+        # The parents are gathered into a copy before any row is
+        # overwritten, and the nets see the new rows through their views
+        self.genomes[:num_children] = self.genomes[parents[np.arange(num_children) % len(parents)]]
+        self.genomes[num_elites:num_children] += np.random.normal(0, self.mutation_amount, (num_children - num_elites, genome_size))
+        self.genomes[num_children:] = np.random.rand(self.num_agents - num_children, genome_size) * 2 - 1
+
+        # Colors come from their own generator so they do not change
+        # the seeded weights
+        base_colors = self.color_rng.integers(40, 121, (self.num_agents, 3)).tolist()
+        rod_colors = self.color_rng.integers(100, 181, (self.num_agents, 3)).tolist()
+        for a, base_color, rod_color in zip(self.agents, base_colors, rod_colors):
+            a.base_color = tuple(base_color)
+            a.rod_color = tuple(rod_color)
+
+
+    def rank_scores(self, scores, complete):
+        """Records the finished episodes in the fitness cache and returns
+        the scores to rank the agents on: the mean score of every trial
+        of the agent's genome for finished episodes, the score itself for
+        episodes cut short by the stop-early rule."""
+        if self.fitness_cache is None:
+            return scores
+
+        ranks = scores.astype(float)
+        for row in np.flatnonzero(complete):
+            ranks[row] = self.fitness_cache.record(self.genomes[row], int(scores[row])).mean
+        return ranks
+
+
+    def end_generation(self, scores, complete, order=None, statistics=None):
+        """Selects the best agents of the generation that just ended,
+        breeds the next generation from them and saves the results once
+        the final epoch has elapsed.
+
+        Parameters:
+        - scores (ndarray): The score of each agent.
+        - complete (ndarray): True for each agent whose episode ended
+                              before the generation was stopped.
+
+        kwargs:
+        - order=None (ndarray): The agents from best to worst. They are
+                                ranked on their scores when None.
+        - statistics=None (dict): The "min" score and "success" rate of
+                                  each agent when it was scored over
+                                  several trials.
+
+        Returns: True if the final epoch has elapsed.
+        """
+        # get the best agents, ties keep their order
+        if order is None:
+            order = np.argsort(-self.rank_scores(scores, complete), kind="stable")
+        scores = [int(scores[i]) for i in order]
+
+        best_agents = [self.agents[i] for i in order[:self.num_reproducing]]
+        print(f"\nGen {self.epochs_elapsed + 1}/{self.epochs}")
+        print("Best scores:", scores[:self.num_reproducing])
+        print("Last index of max score:", max(i for i, s in enumerate(scores) if s == scores[0]))
+        print("Average:", sum(scores) / len(scores))
+
+        if statistics is None:
+            self.stats.append(scores)
+        else:
+            # what multi-trial agents may be selected on, in the same order
+            min_scores = [int(statistics["min"][i]) for i in order]
+            successes = [int(round(statistics["success"][i] * self.trials)) for i in order]
+            print("Best min scores:", min_scores[:self.num_reproducing])
+            print("Best success rates:", [float(statistics["success"][i]) for i in order[:self.num_reproducing]])
+            print("Average min score:", sum(min_scores) / len(min_scores))
+            print("Average success rate:", sum(successes) / (len(successes) * self.trials))
+            self.stats.append(scores, min_scores, successes)
+
+        if not self.stop_early:
+            # >= so later successful nets are favored over earlier ones 
+            if scores[0] >= self.best_score:
+                self.best_score = scores[0]
+                # the agents are reused by the next generation
+                self.best_agent = best_agents[0].new_copy(preserve_color=True)
+
+        # no later generation to breed after the final one
+        finished = self.epochs_elapsed + 1 >= self.epochs
+        with self.profiler.phase("reproduction"):
+            if not finished:
+                self.breed(order[:self.num_reproducing])
+
+            self.increment_epoch()
+            if not finished:
+                self.start_generation()
+
+        if not finished and self.checkpoint_every > 0 and self.epochs_elapsed % self.checkpoint_every == 0:
+            with self.profiler.phase("checkpoint"):
+                self.save_checkpoint()
+                if self.fitness_cache is not None:
+                    self.fitness_cache.save()
+
+        if self.profiler is not NULL_PROFILER:
+            print(self.profiler.report(self.num_agents))
+            self.profiler.reset()
 
-                self.epoch_text = self.font.render(f"Epoch {self.epochs_elapsed + 2}", True, (0, 0, 0), SCREEN_BACKGROUND_COLOR)
+        self.set_active_agent(0)
 
-                if self.increment_epoch():
-                    # Sim is over, save the best network and the score stats from training
-                    name_with_params = f"{self.savename}_{self.num_agents}a_{self.num_reproducing}r_{self.epochs}e_{SUCCESS_THRESHOLD}"
-                    self.best_agent.save_network(name_with_params)
-                    with open(f"{name_with_params}_stats.pickle", "wb") as f:
-                        pickle.dump(self.score_lists, f)
-                    break
+        if self.do_graphics:
+            self.epoch_text = self.font.render(f"Epoch {self.epochs_elapsed + 1}", True, (0, 0, 0), SCREEN_BACKGROUND_COLOR)
+
+        if finished:
+            # Sim is over, save the best network. The score stats are
+            # already on disk.
+            self.best_agent.save_network(self.name_with_params)
+            print(f"Scores of every generation saved in {self.stats.path}")
+            if self.fitness_cache is not None:
+                self.fitness_cache.save()
+            return True
+
+        return False
+
+
+def checkpoint_arguments(path):
+    """Returns the command line arguments the run saved in a checkpoint
+    was started with, as a dict keyed like the parsed arguments.
+    Checkpoints of older versions leave out the options they did not
+    record."""
+    state = load_checkpoint(path)
+    arguments = {
+        "agents": int(state["num_agents"]),
+        "reproducers": int(state["num_reproducing"]),
+        "chainlength": int(state["chain_length"]),
+        "epochs": int(state["epochs"]),
+        "savename": str(state["savename"]),
+    }
+
+    if "precision" in state:
+        tolerance = float(state["constraint_tolerance"])
+        arguments.update(
+            precision=str(state["precision"]),
+            backend=str(state["backend"]),
+            constraint_solver=str(state["constraint_solver"]),
+            constraint_iterations=int(state["constraint_iterations"]),
+            constraint_tolerance=None if np.isnan(tolerance) else tolerance,
+            trials=int(state["trials"]),
+            select=str(state["select"]),
+            halving_horizons=[int(h) for h in state["halving_horizons"]] or None,
+            halving_keep=[float(k) for k in state["halving_keep"]],
+        )
+    if "fitness_cache" in state:
+        arguments["fitness_cache"] = str(state["fitness_cache"]) or None
+    return arguments
 
 
 def main():
@@ -294,7 +678,36 @@ def main():
     parser.add_argument("-n", "--nographics", action="store_true", help="disable graphics")
     parser.add_argument("-l", "--loadname", metavar="NETWORK_NAME", type=str, help="the neural network file to load. Will not train the loaded network")
     parser.add_argument("-s", "--savename", metavar="NETWORK_NAME", type=str, help="the name of the file the best network will be saved in")
+    parser.add_argument("--episodes", action="store_true", help="run each agent in its own episode in a compiled loop instead of stepping all agents in lockstep (requires --nographics and Numba)")
+    parser.add_argument("--seed", metavar="SEED", type=int, help="seed for the nets and the physics noise, so a run can be reproduced")
+    parser.add_argument("--checkpoint-every", metavar="NUMBER_OF_EPOCHS", type=int, default=10, help="save a checkpoint of the run every this many epochs (0 disables checkpoints)")
+    parser.add_argument("--resume", metavar="CHECKPOINT", type=str, help="continue the run saved in a checkpoint file with the options it was started with, which must not be given differently")
+    parser.add_argument("--fitness-cache", metavar="CACHE_FILE", type=str, help="remember the scores of every genome in this file and rank agents on the mean score of all trials of their genome")
+    parser.add_argument("--halving-horizons", metavar="FRAMES", type=int, nargs="+", help="evaluate generations by successive halving: run every agent to the first horizon, keep the best of them for the next and run the last ones kept to the end (requires --nographics)")
+    parser.add_argument("--halving-keep", metavar="FRACTION", type=float, nargs="+", default=[0.5], help="the fraction of agents kept after each halving round, either one for every round or one per horizon (default: 0.5)")
+    parser.add_argument("--trials", metavar="NUMBER_OF_TRIALS", type=int, default=1, help="number of episodes with different noise each net is scored over, simulated together (requires --nographics)")
+    parser.add_argument("--select", choices=["mean", "min", "success"], default="mean", help="the statistic of the trials of a net that agents are selected on: mean score, minimum score or success rate (default: mean)")
+    parser.add_argument("--precision", choices=["float64", "float32"], default="float64", help="floating point precision of the physics and the nets while training (default: float64). Compare them with compare_precision.py")
+    parser.add_argument("--backend", choices=kernels.BACKENDS, default="numpy", help="kernels of the batched physics: the NumPy reference or Numba compiled loops, which fall back to NumPy when Numba is not installed (default: numpy)")
+    parser.add_argument("--profile", action="store_true", help="print how long each phase of a generation took (inference, physics, scoring, drawing, ...) after its scores")
+    parser.add_argument("--constraint-solver", choices=list(ConstraintSolver.METHODS), default="relax", help="how the sticks of each skeleton are kept at their lengths: relaxed one after another, or solved all at once along the chain, which stays tight on long chains (default: relax)")
+    parser.add_argument("--constraint-iterations", metavar="PASSES", type=int, help="number of solver passes over the sticks of each skeleton per frame, or the most of them with --constraint-tolerance (default: 3 for relax, 1 for chain)")
+    parser.add_argument("--constraint-tolerance", metavar="TOLERANCE", type=float, help="stop relaxing a skeleton once no stick's length is off by more than this fraction of its rest length")
+    parser.add_argument("--render-every", metavar="FRAMES", type=int, default=1, help="with graphics, only draw every this many simulated frames (default: 1)")
+    parser.add_argument("--render-fps", metavar="FPS", type=float, help="with graphics, draw at most this many times per second of wall-clock time while the simulation runs at full speed")
+    parser.add_argument("--max-drawn", metavar="NUMBER_OF_AGENTS", type=int, help="with graphics, draw only this many of the agents of a larger population, always including the highlighted one")
+    parser.add_argument("-w", "--workers", metavar="NUMBER_OF_WORKERS", type=int, default=1, help="number of worker processes to split each generation across (requires --nographics)")
     args = parser.parse_args()
+
+    if args.resume is not None:
+        # A resumed run keeps the options it was started with. Options
+        # that are given again must be the same.
+        for name, value in checkpoint_arguments(args.resume).items():
+            given = getattr(args, name)
+            if given != parser.get_default(name) and given != value:
+                print(f"[main]: {args.resume} was saved with --{name.replace('_', '-')} {value}, not {given}")
+                sys.exit()
+            setattr(args, name, value)
     
     if args.agents > 1000:
         if input("Are you sure you want to run the simulation with over 1000 agents? (Y/n) ").lower() != "y":
@@ -309,9 +722,101 @@ def main():
         print("[main]: load and save are mutually exclusive")
         sys.exit()
 
+    if args.workers > 1 and not args.nographics:
+        print("[main]: multiple workers require --nographics")
+        sys.exit()
+
+    if args.seed is not None and not 0 <= args.seed < 2**32:
+        print("[main]: the seed must be between 0 and 2**32 - 1")
+        sys.exit()
+
+    if args.episodes and not args.nographics:
+        print("[main]: episodes require --nographics")
+        sys.exit()
+
+    if args.episodes and kernels.resolve_backend("numba") != "numba":
+        print("[main]: episodes are run by compiled kernels and require Numba (pip install -r requirements.txt)")
+        sys.exit()
+
+    if args.halving_horizons is not None:
+        if not args.nographics:
+            print("[main]: successive halving requires --nographics")
+            sys.exit()
+
+        if args.workers > 1 or args.episodes:
+            print("[main]: successive halving cannot be combined with --workers or --episodes")
+            sys.exit()
+
+        if args.halving_horizons != sorted(args.halving_horizons) or args.halving_horizons[0] < 1:
+            print("[main]: the halving horizons must be positive and increasing")
+            sys.exit()
+
+        if len(args.halving_keep) not in (1, len(args.halving_horizons)) or not all(0 < k <= 1 for k in args.halving_keep):
+            print("[main]: give one keep fraction in (0, 1] for every halving horizon, or a single one for all")
+            sys.exit()
+
+    if args.precision != "float64" and args.episodes:
+        print("[main]: episodes are always simulated in float64")
+        sys.exit()
+
+    if kernels.resolve_backend(args.backend) != args.backend:
+        print(f"[main]: Numba is not installed, using the {kernels.resolve_backend(args.backend)} backend")
+
+    if args.constraint_iterations is not None and args.constraint_iterations < 0:
+        print("[main]: --constraint-iterations cannot be negative")
+        sys.exit()
+
+    if args.constraint_tolerance is not None and args.constraint_tolerance < 0:
+        print("[main]: --constraint-tolerance cannot be negative")
+        sys.exit()
+
+    if args.render_every < 1:
+        print("[main]: --render-every must be at least 1")
+        sys.exit()
+
+    if args.render_fps is not None and args.render_fps <= 0:
+        print("[main]: --render-fps must be positive")
+        sys.exit()
+
+    if args.max_drawn is not None and args.max_drawn < 1:
+        print("[main]: --max-drawn must be at least 1")
+        sys.exit()
+
+    if args.trials < 1:
+        print("[main]: there must be at least one trial")
+        sys.exit()
+
+    if args.trials > 1:
+        if not args.nographics:
+            print("[main]: multiple trials require --nographics")
+            sys.exit()
+
+        if args.workers > 1 or args.episodes or args.halving_horizons is not None or args.fitness_cache is not None:
+            print("[main]: multiple trials cannot be combined with --workers, --episodes, --halving-horizons or --fitness-cache")
+            sys.exit()
+
+    elif args.select != "mean":
+        print("[main]: selecting on a statistic other than the mean requires --trials")
+        sys.exit()
+
     chain_length = args.chainlength if args.chainlength is not None else 0
 
-    sim = Simulation(args.agents, not args.nographics, num_reproducing=args.reproducers, epochs=args.epochs, chain_length=chain_length, loadfile=args.loadname, savefile=args.savename)
+    options = dict(num_agents=args.agents, num_reproducing=args.reproducers, epochs=args.epochs, chain_length=chain_length, savefile=args.savename)
+
+    solver = ConstraintSolver(args.constraint_iterations, args.constraint_tolerance, method=args.constraint_solver)
+
+    fitness_cache = None
+    if args.fitness_cache is not None:
+        fitness_cache = FitnessCache(chain_length, path=args.fitness_cache, solver=solver, precision=args.precision,
+                                     backend=kernels.resolve_backend(args.backend))
+
+    sim = Simulation(do_graphics=not args.nographics, workers=args.workers, episodes=args.episodes, seed=args.seed,
+                     checkpoint_every=args.checkpoint_every, resume=args.resume, fitness_cache=fitness_cache,
+                     halving_horizons=args.halving_horizons, halving_keep=args.halving_keep,
+                     trials=args.trials, select=args.select, precision=args.precision,
+                     backend=args.backend, profile=args.profile,
+                     render_every=args.render_every, render_fps=args.render_fps, max_drawn=args.max_drawn, solver=solver,
+                     loadfile=args.loadname, **options)
     sim.run()
 
 if __name__ == "__main__":
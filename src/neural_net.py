@@ -16,7 +16,6 @@ https://vtechworks.lib.vt.edu/bitstream/handle/10919/51904/LD5655.V855_1988.L362
 
 import pickle
 import numpy as np
-import pygame
 from activations import *
 from constants import *
 import math
@@ -32,8 +31,11 @@ class NeuralNet:
         self.output_size = output_size
 
         # List of Numpy arrays to represent matrices holding 
-        # weights of connections between nodes
+        # weights of connections between nodes. They are views into
+        # self.params, one contiguous vector holding every weight.
         self.weights = [np.random.rand(input_size, output_size)]
+        self.params = None
+        self.__flatten()
 
         # List of Numpy arays representing vectors holding the 
         # activations of nodes
@@ -44,6 +46,12 @@ class NeuralNet:
         # Does the input layer use activations? TODO
         self.activations = [None, activation]
 
+        # Buffers used by inference only evaluation, created on demand
+        self.__scratch = None
+
+        # The edges as drawn by draw, kept until the weights change
+        self.__edge_cache = None
+
     @classmethod
     def net_from_file(cls, filepath):
         """Loads a network from a file path and returns it wrapped in a neural net instance."""
@@ -59,6 +67,56 @@ class NeuralNet:
         return saved_net
 
 
+    def __getstate__(self):
+        """Leaves the inference scratch buffers, the drawn edges and the
+        flat parameter vector out of saved nets, which keeps the saved
+        format the same as that of older nets."""
+        state = self.__dict__.copy()
+        state.pop("_NeuralNet__scratch", None)
+        state.pop("_NeuralNet__edge_cache", None)
+        state.pop("params", None)
+        state["weights"] = [np.copy(w) for w in self.weights]
+        return state
+
+
+    def __setstate__(self, state):
+        """Restores a pickled net, including nets saved before the
+        scratch buffers and the flat parameter vector existed."""
+        self.__dict__.update(state)
+        self.__scratch = None
+        self.__edge_cache = None
+        self.__flatten()
+
+
+    def __flatten(self, params=None):
+        """Moves the weights into one contiguous vector and makes the
+        weight matrices views into it.
+
+        kwargs:
+        - params=None (ndarray): The vector to hold the weights, which
+                may be a row of a larger matrix. It is overwritten with
+                the current weights. A new vector is allocated when None.
+
+        Returns: None
+        """
+        if params is None:
+            params = np.empty(sum(w.size for w in self.weights))
+        params[:] = np.concatenate([w.ravel() for w in self.weights])
+
+        self.params = params
+        self.__view_weights()
+
+
+    def __view_weights(self):
+        """Points the weight matrices at their slices of self.params."""
+        views = []
+        offset = 0
+        for weight in self.weights:
+            views.append(self.params[offset:offset + weight.size].reshape(weight.shape))
+            offset += weight.size
+        self.weights = views
+
+
     def save(self, filepath):
         """Save this instance via the pickler."""
         
@@ -68,22 +126,41 @@ class NeuralNet:
 
     
     def copy(self):
-        nn = NeuralNet(self.input_size, self.output_size, self.activations[1])
-        nn.weights = [np.copy(x) for x in self.weights]
+        nn = NeuralNet.__new__(NeuralNet)
+        nn.input_size = self.input_size
+        nn.output_size = self.output_size
+        nn.weights = self.weights
+        nn.params = self.params.copy()
+        nn.__view_weights()
         nn.nodes = [np.copy(x) for x in self.nodes]
         nn.activations = [x for x in self.activations]
+        nn.__scratch = None
+        nn.__edge_cache = None
         return nn
 
     
+    def genome(self):
+        """Returns the weights of every layer flattened into one vector.
+        This is the net's own parameter vector, not a copy."""
+        return self.params
+
+
+    def set_genome(self, genome):
+        """Sets the weights of every layer from a vector laid out like the
+        one returned by genome."""
+        self.params[:] = genome
+
+
+    def use_genome(self, genome):
+        """Makes the net keep its weights in `genome`, e.g. a row of a
+        population's (N, G) genome matrix, after copying them there.
+        Changes to the vector then change the net and vice versa."""
+        self.__flatten(genome)
+
+
     def noisy_copy(self, std_dev=1):
         nn = self.copy()
-        
-        for weight in nn.weights:
-            weight += np.random.normal(0, std_dev, weight.shape)
-        
-        for layer in nn.nodes:
-            layer += np.random.normal(0, std_dev, layer.shape)
-        
+        nn.params += np.random.normal(0, std_dev, nn.params.shape)
         return nn
 
 
@@ -105,33 +182,53 @@ class NeuralNet:
         # Weights out of the hidden layer
         self.weights.append(np.random.rand(self.output_size, size) * 2 - 1)
 
+        self.__flatten()
+
+        # The layer sizes changed so the scratch buffers are stale
+        self.__scratch = None
 
-    def evaluate(self, data):
+
+    def evaluate(self, data, inference_only=False):
         """Passes `data` into the input layer of the net and returns
         the activations of the output layer.
         data -- should be a flattened representation of the sample.
+
+        kwargs:
+        - inference_only=False (bool): Compute the layers in private
+                buffers instead of `nodes`. The node activations are
+                then not recorded, which is fine unless the net is
+                being drawn.
+
+        The returned array is a buffer owned by the net and is
+        overwritten by the next call.
         """
         #TODO NO biasing yet
 
-        # Apply the data values to the input layer 
-        for i, _ in enumerate(data):
-            self.nodes[0][i] = data[i]
+        if inference_only:
+            layers = self.__get_scratch()
+            acts = np.asarray(data, dtype=float)
+        else:
+            # Apply the data values to the input layer
+            layers = self.nodes
+            layers[0][:] = data
+            acts = layers[0]
 
         # Work layer by layer appling weights and calculating 
-        # activation
-        for i in range(1, len(self.nodes)):
-            raw_acts = np.dot(self.weights[i-1], self.nodes[i-1])
-            
-            # Then apply the activation function to each element
-            act_f = self.activations[i]
-            actual_acts = [act_f(x) for x in raw_acts]
-            
-            # copy into the net
-            for j, _ in enumerate(actual_acts):
-                self.nodes[i][j] = actual_acts[j]
+        # activation, in place in the preallocated layer buffers
+        for i in range(1, len(layers)):
+            np.dot(self.weights[i-1], acts, out=layers[i])
+            acts = self.activations[i](layers[i], out=layers[i])
 
         # Return the activations of the output layer
-        return self.nodes[-1][:]
+        return acts
+
+
+    def __get_scratch(self):
+        """Returns the buffers for inference only evaluation, one per
+        layer after the input layer, allocating them on first use."""
+        if self.__scratch is None:
+            self.__scratch = [None] + [np.zeros(len(layer)) for layer in self.nodes[1:]]
+        return self.__scratch
 
 
     def __calc_node_color(self, value):
@@ -200,8 +297,35 @@ class NeuralNet:
     def draw(self, canvas):
         """Draws a graph like representation of the current state of
         the neural network to the given tkinter canvas.  The gradient 
-        represents the weights of the edges."""
+        represents the weights of the edges.
+
+        The edges only depend on the weights, so they are drawn once
+        onto a cached surface that is redrawn when the weights or the
+        size of the canvas change. Only the nodes are drawn each call."""
+        # pygame is only needed once rendering is requested
+        import pygame
+
+        # The weights may change in place, e.g. through a population's
+        # genome matrix, so they are compared with the cached ones
+        cache = self.__edge_cache
+        if cache is None or cache[0] != canvas.get_size() or not np.array_equal(cache[1], self.params):
+            cache = self.__edge_cache = self.__draw_edges(canvas.get_size())
+        _, _, node_positions, edges, edges_pos = cache
 
+        # First draw the nodes
+        for i, layer in enumerate(node_positions):
+            for j, (x0, y0) in enumerate(layer):
+                fill = self.__get_node_color(self.nodes[i][j])
+                pygame.draw.circle(canvas, fill, (x0, y0), NODE_RADIUS)
+                pygame.draw.circle(canvas, (0, 0, 0), (x0, y0), NODE_RADIUS, 1)
+
+        # Then the connections on top
+        canvas.blit(edges, edges_pos)
+
+
+    def __node_positions(self, size):
+        """Returns the center of every node on a canvas of the given
+        size, as a list of (x, y) per node per layer."""
         # Calculate the offset needed to align the middle of each 
         # node layer
         # First get the longest layer index
@@ -212,14 +336,10 @@ class NeuralNet:
 
         # Offest for dawing the network
         net_width = len(self.nodes) * (NODE_RADIUS*2+LAYER_SPACE) - LAYER_SPACE
-        x_offset = canvas.get_width()/2 - net_width/2
-        y_offset = canvas.get_height()/4 - longest_height/2
+        x_offset = size[0]/2 - net_width/2
+        y_offset = size[1]/4 - longest_height/2
 
-        # Store the node positions for reference when drawing the
-        # edges.
         node_positions = []
-
-        # First draw the nodes
         for i, _ in enumerate(self.nodes):
             length = len(self.nodes[i])
             height = length * (NODE_RADIUS*2 + NODE_VERT_SPACE)
@@ -228,22 +348,28 @@ class NeuralNet:
             diff = longest_height - height
             vert_offset = diff/2
 
-            node_positions.append(self.nodes[i].tolist())
-
+            node_positions.append([])
             for j, _ in enumerate(self.nodes[i]):
                 x0 = i*(NODE_RADIUS*2 + LAYER_SPACE) + NODE_RADIUS
                 y0 = j*(NODE_RADIUS*2 + NODE_VERT_SPACE) + vert_offset + NODE_RADIUS
 
-                x0 += x_offset
-                y0 += y_offset
-                
-                fill = self.__get_node_color(self.nodes[i][j])
-                pygame.draw.circle(canvas, fill, (x0, y0), NODE_RADIUS)
-                pygame.draw.circle(canvas, (0, 0, 0), (x0, y0), NODE_RADIUS, 1)
-                
-                node_positions[i][j] = (x0, y0)
+                node_positions[i].append((x0 + x_offset, y0 + y_offset))
+
+        return node_positions
+
+
+    def __draw_edges(self, size):
+        """Draws the connections of the net onto a transparent surface
+        covering just the edges, for a canvas of the given size.
 
-        # Then draw the connections
+        Returns: The cache entry (size, weights, node positions, surface,
+                 position of the surface on the canvas).
+        """
+        import pygame
+
+        node_positions = self.__node_positions(size)
+
+        lines = []
         for i, _ in enumerate(self.weights): #weight layer
             for j, _ in enumerate(node_positions[i]): #node input
                 x0 = node_positions[i][j][0] + NODE_RADIUS
@@ -257,4 +383,18 @@ class NeuralNet:
 
                     width = round(5 * abs(self.weights[i][k][j])) + 1
 
-                    pygame.draw.line(canvas, fill, (x0, y0), (x1, y1), width=width)
+                    lines.append((fill, x0, y0, x1, y1, width))
+
+        # The surface is placed at whole pixels so the lines land on the
+        # same pixels as when drawn straight onto the canvas
+        pad = max((line[5] for line in lines), default=0) + 2
+        left = math.floor(min((min(line[1], line[3]) for line in lines), default=0) - pad)
+        top = math.floor(min((min(line[2], line[4]) for line in lines), default=0) - pad)
+        right = math.ceil(max((max(line[1], line[3]) for line in lines), default=0) + pad)
+        bottom = math.ceil(max((max(line[2], line[4]) for line in lines), default=0) + pad)
+
+        edges = pygame.Surface((right - left, bottom - top), pygame.SRCALPHA)
+        for fill, x0, y0, x1, y1, width in lines:
+            pygame.draw.line(edges, fill, (x0 - left, y0 - top), (x1 - left, y1 - top), width=width)
+
+        return (size, self.params.copy(), node_positions, edges, (left, top))
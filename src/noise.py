@@ -0,0 +1,120 @@
+"""
+noise.py
+
+Seeded noise for the physics of an episode. Every episode draws its base
+force noise and rod acceleration noise from its own NumPy Generator, in
+blocks of frames rather than one scalar at a time. An episode seeded the
+same way sees the same noise whether its agent is simulated on its own,
+in a batched population or in a worker process.
+"""
+
+import numpy as np
+
+from constants import BASE_FORCE_NOISE, ROD_ACC_NOISE
+
+
+def episode_seed(seed, epoch, row):
+    """Returns the seed of the episode of agent `row` in generation
+    `epoch` of a run started with `seed`."""
+    return [seed, epoch, row]
+
+
+def trial_seed(seed, trial):
+    """Returns the seed of trial number `trial` of the episode seeded
+    with `seed`, a list as returned by episode_seed. The first trial
+    uses the episode's own seed."""
+    return seed if trial == 0 else list(seed) + [trial]
+
+
+class NoiseStream:
+    """The noise of one episode."""
+
+    # Number of frames of noise generated at once
+    BLOCK_SIZE = 256
+
+    def __init__(self, num_points, seed=None):
+        """Creates a stream.
+
+        Parameters:
+        - num_points (int): The number of points of the skeleton that are
+                            moved by the physics, i.e. all but the base.
+
+        kwargs:
+        - seed=None: Anything np.random.default_rng accepts. Fresh
+                     entropy is used when None.
+
+        Returns: None
+        """
+        self.num_points = num_points
+        self.rng = np.random.default_rng(seed)
+
+        self.__force = None
+        self.__rod = None
+        self.__index = self.BLOCK_SIZE
+
+
+    def next_block(self):
+        """Generates the noise of the next BLOCK_SIZE frames.
+
+        Returns: (force noise of shape (BLOCK_SIZE,),
+                  rod acceleration noise of shape (BLOCK_SIZE, num_points))
+        """
+        force = self.rng.uniform(-BASE_FORCE_NOISE, BASE_FORCE_NOISE, self.BLOCK_SIZE)
+        rod = self.rng.uniform(-ROD_ACC_NOISE, ROD_ACC_NOISE, (self.BLOCK_SIZE, self.num_points))
+        return force, rod
+
+
+    def draw(self):
+        """Returns the noise of the next frame as (force noise (float),
+        rod acceleration noise (ndarray of num_points))."""
+        if self.__index == self.BLOCK_SIZE:
+            self.__force, self.__rod = self.next_block()
+            self.__index = 0
+
+        i = self.__index
+        self.__index += 1
+        return self.__force[i], self.__rod[i]
+
+
+class PopulationNoise:
+    """The noise streams of a population whose agents are advanced
+    together, one frame at a time."""
+
+    def __init__(self, num_points, seeds, dtype=float):
+        """Creates one stream per agent.
+
+        Parameters:
+        - num_points (int): The number of points of each skeleton that
+                            are moved by the physics.
+        - seeds [seed]: The seed of each agent's stream.
+
+        kwargs:
+        - dtype=float: The floating point type the noise is rounded to.
+                       It is always generated in float64, so the noise
+                       is the same up to rounding in every precision.
+
+        Returns: None
+        """
+        self.streams = [NoiseStream(num_points, seed) for seed in seeds]
+
+        self.force = np.zeros((len(seeds), NoiseStream.BLOCK_SIZE), dtype=dtype)
+        self.rod = np.zeros((len(seeds), NoiseStream.BLOCK_SIZE, num_points), dtype=dtype)
+        self.frame = 0
+
+
+    def draw(self, rows):
+        """Returns the noise of the next frame for the given agents, all of
+        which must have been drawn for on every earlier frame.
+
+        Parameters:
+        - rows (ndarray): Indices of the agents.
+
+        Returns: (force noise of shape (M,), rod noise of shape (M, num_points))
+        """
+        i = self.frame % NoiseStream.BLOCK_SIZE
+        if i == 0:
+            for row in rows:
+                self.force[row], self.rod[row] = self.streams[row].next_block()
+
+        self.frame += 1
+        return self.force[rows, i], self.rod[rows, i]
@@ -0,0 +1,171 @@
+"""
+parallel.py
+
+Evaluates generations across a pool of worker processes. Agents never
+interact, so the population is split into shards and each worker
+simulates its own shard. Genomes and results are exchanged through
+shared memory; only small commands go through the pipes.
+
+The workers do not step in lockstep with each other. The stop-early rule
+is reproduced by a StopEarlyScheduler, which has every worker advance its
+shard in rounds.
+"""
+
+import multiprocessing
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from body import DEFAULT_SOLVER
+from population import Population
+from population_net import PopulationNet
+from scheduler import StopEarlyScheduler
+from profiler import NULL_PROFILER
+
+# Rows of the shared results matrix
+FRAMES_ALIVE = 0
+RUNNING = 1
+SCORES = 2
+
+
+def shard_worker(conn, genomes_name, results_name, num_agents, genome_size, shard, chain_length, shapes, activations, delta_t, dtype, backend, solver):
+    """Main loop of a worker process simulating the agents in the range
+    `shard` = (first, last + 1) of the population."""
+
+    genomes_shm = SharedMemory(name=genomes_name)
+    results_shm = SharedMemory(name=results_name)
+    genomes = np.ndarray((num_agents, genome_size), dtype=float, buffer=genomes_shm.buf)
+    results = np.ndarray((3, num_agents), dtype=np.int64, buffer=results_shm.buf)
+    lo, hi = shard
+
+    population = None
+    while True:
+        command, arg = conn.recv()
+
+        if command == "start":
+            # Copy the genomes so the parent may reuse the shared block
+            population_net = PopulationNet.from_genomes(genomes[lo:hi].astype(dtype), shapes, activations)
+            population = Population(population_net, chain_length, seeds=arg[lo:hi], backend=backend, solver=solver)
+            conn.send(None)
+
+        elif command == "advance":
+            if arg is not None:
+                population.scorer.record_history(arg - population.scorer.frame)
+            alive = population.run(delta_t, horizon=arg)
+
+            results[FRAMES_ALIVE, lo:hi] = population.scorer.frames_alive
+            results[RUNNING, lo:hi] = population.scorer.running
+            conn.send(alive)
+
+        elif command == "finish":
+            results[SCORES, lo:hi] = population.scorer.scores_at(arg)
+            conn.send(None)
+
+        elif command == "close":
+            break
+
+    del genomes, results
+    genomes_shm.close()
+    results_shm.close()
+
+
+class ShardedEvaluator:
+    """Scores generations of agents in a pool of worker processes."""
+
+    def __init__(self, num_workers, num_agents, num_reproducing, chain_length, shapes, activations, delta_t=1/60, dtype=float, backend="numpy", solver=DEFAULT_SOLVER, profiler=NULL_PROFILER):
+        """Starts the worker processes.
+
+        Parameters:
+        - num_workers (int): The number of worker processes.
+        - num_agents (int): The number of agents in each generation.
+        - num_reproducing (int): The number of agents that reproduce.
+        - chain_length (int): The chain length of every agent.
+        - shapes [(out, in)]: The shape of each weight layer of the nets.
+        - activations [function]: The activation function of each layer
+                                  after the input layer.
+
+        kwargs:
+        - delta_t=1/60 (float): The number of seconds in a frame.
+        - dtype=float: The floating point type the workers simulate in.
+                       Genomes are always shared in float64.
+        - backend="numpy" (str): The physics kernels, see kernels.py.
+        - solver=DEFAULT_SOLVER (ConstraintSolver): How the sticks are
+                kept at their lengths.
+        - profiler=NULL_PROFILER: Times the time spent waiting for the
+                workers, whose own phases are not profiled.
+
+        Returns: None
+        """
+        self.num_agents = num_agents
+        self.scheduler = StopEarlyScheduler(num_reproducing)
+        self.profiler = profiler
+        genome_size = sum(rows*cols for (rows, cols) in shapes)
+
+        self.__genomes_shm = SharedMemory(create=True, size=max(1, num_agents*genome_size*8))
+        self.__results_shm = SharedMemory(create=True, size=3*num_agents*8)
+        self.genomes = np.ndarray((num_agents, genome_size), dtype=float, buffer=self.__genomes_shm.buf)
+        self.results = np.ndarray((3, num_agents), dtype=np.int64, buffer=self.__results_shm.buf)
+
+        self.__conns = []
+        self.__workers = []
+        for shard in np.array_split(np.arange(num_agents), min(num_workers, num_agents)):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=shard_worker,
+                args=(child_conn, self.__genomes_shm.name, self.__results_shm.name, num_agents, genome_size,
+                      (shard[0], shard[-1] + 1), chain_length, shapes, activations, delta_t, dtype, backend, solver),
+                daemon=True,
+            )
+            worker.start()
+            self.__conns.append(parent_conn)
+            self.__workers.append(worker)
+
+
+    def __broadcast(self, command, arg=None):
+        """Sends a command to every worker and returns their replies."""
+        for conn in self.__conns:
+            conn.send((command, arg))
+        return [conn.recv() for conn in self.__conns]
+
+
+    def evaluate(self, agents, stop_early, seeds):
+        """Simulates one generation and returns the score of every agent.
+
+        Parameters:
+        - agents [Agent]: The agents to evaluate.
+        - stop_early (bool): Stop once at most num_reproducing agents are
+                             running, like Simulation.run does.
+        - seeds [seed]: The seed of each agent's noise stream.
+
+        Returns: (scores, complete) where scores is an ndarray of scores,
+                 one per agent, and complete is a boolean ndarray that is
+                 True for the agents whose episode ended by the stop frame.
+        """
+        self.genomes[:] = [a.net.genome() for a in agents]
+        self.__broadcast("start", seeds)
+
+        def advance(horizon):
+            alive = sum(self.__broadcast("advance", horizon))
+            return self.results[FRAMES_ALIVE], alive
+
+        with self.profiler.phase("workers"):
+            stop_frame = self.scheduler.run(advance, stop_early)
+            self.__broadcast("finish", stop_frame)
+        self.profiler.count("agent frames", int(self.results[FRAMES_ALIVE].sum()))
+
+        complete = (self.results[RUNNING] == 0) & (self.results[FRAMES_ALIVE] <= stop_frame)
+        return self.results[SCORES].copy(), complete
+
+
+    def close(self):
+        """Stops the workers and frees the shared memory."""
+        for conn in self.__conns:
+            conn.send(("close", None))
+        for worker in self.__workers:
+            worker.join()
+
+        del self.genomes, self.results
+        self.__genomes_shm.close()
+        self.__genomes_shm.unlink()
+        self.__results_shm.close()
+        self.__results_shm.unlink()
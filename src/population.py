@@ -0,0 +1,129 @@
+"""
+population.py
+
+Bundles the batched nets, bodies and scores of one generation of agents
+and advances them together, one frame at a time.
+"""
+
+import numpy as np
+
+from agent import Agent
+from body import DEFAULT_SOLVER
+from population_body import PopulationBody
+from population_scorer import PopulationScorer
+from noise import PopulationNoise
+from profiler import NULL_PROFILER
+from constants import SUCCESS_THRESHOLD
+
+
+class Population:
+    """A generation of agents simulated as arrays."""
+
+    def __init__(self, population_net, chain_length, seeds=None, backend="numpy", solver=DEFAULT_SOLVER, profiler=NULL_PROFILER):
+        """Creates the bodies and scores for the nets of a PopulationNet.
+        The physics use the floating point type of the nets' weights.
+
+        Parameters:
+        - population_net (PopulationNet): The nets of the agents.
+        - chain_length (int): The chain length of every agent.
+
+        kwargs:
+        - seeds=None [seed]: The seed of each agent's noise stream. Fresh
+                             entropy is used when None.
+        - backend="numpy" (str): The physics kernels, see kernels.py.
+        - solver=DEFAULT_SOLVER (ConstraintSolver): How the sticks are
+                kept at their lengths.
+        - profiler=NULL_PROFILER: Times the phases of every step and
+                counts the constraint passes.
+
+        Returns: None
+        """
+        points, sticks = Agent.skeleton_shape(chain_length)
+        if seeds is None:
+            seeds = [None] * len(population_net)
+
+        self.net = population_net
+        dtype = population_net.genomes.dtype
+        self.body = PopulationBody(len(population_net), points, sticks, dtype=dtype, backend=backend, solver=solver)
+        self.scorer = PopulationScorer(len(population_net))
+        self.noise = PopulationNoise(len(points) - 1, seeds, dtype=dtype)
+        self.profiler = profiler
+
+        # Sorted indices of the agents that are still running. Finished
+        # agents are dropped as they die so that the per-frame work only
+        # depends on the number of live agents.
+        self.alive = np.arange(len(population_net))
+
+
+    def __len__(self):
+        return len(self.scorer)
+
+
+    def step(self, delta_t, stop_at_threshold=True):
+        """Advances every running agent by one frame.
+
+        Parameters:
+        - delta_t (float): The number of seconds in a frame.
+
+        kwargs:
+        - stop_at_threshold=True (bool): Stop agents once their score
+                                         exceeds SUCCESS_THRESHOLD.
+
+        Returns: None
+        """
+        alive = self.alive
+        if len(alive) == 0:
+            return
+
+        profiler = self.profiler
+        profiler.count("agent frames", len(alive))
+
+        with profiler.phase("inference"):
+            # the weights only need gathering once some agents are done
+            net_rows = alive if len(alive) < len(self) else None
+            efforts = self.net.evaluate(self.body.net_inputs(alive), rows=net_rows)
+        with profiler.phase("noise"):
+            force_noise, acc_noise = self.noise.draw(alive)
+        with profiler.phase("physics"):
+            self.body.apply_force(np.tanh(efforts[:, 0]), alive, delta_t, force_noise)
+            profiler.count("solver passes", self.body.move(alive, delta_t, acc_noise))
+            if profiler is not NULL_PROFILER:
+                profiler.peak("stick error", self.body.stick_error(alive))
+
+        with profiler.phase("scoring"):
+            threshold = SUCCESS_THRESHOLD if stop_at_threshold else None
+            self.scorer.update(self.body, alive, threshold=threshold)
+
+            # compact the active set
+            self.alive = alive[self.scorer.running[alive]]
+
+
+    def stop(self, rows):
+        """Stops advancing the given agents. Their episodes are not over,
+        so they keep running in the scorer with the score they have.
+
+        Parameters:
+        - rows (ndarray): Indices of the agents.
+
+        Returns: None
+        """
+        self.alive = np.setdiff1d(self.alive, rows, assume_unique=True)
+
+
+    def run(self, delta_t, horizon=None):
+        """Advances the agents until all of them are done or `horizon`
+        frames have passed.
+
+        Parameters:
+        - delta_t (float): The number of seconds in a frame.
+
+        kwargs:
+        - horizon=None (int): The frame to stop at. Runs until every
+                              agent is done when None.
+
+        Returns: The number of agents still running (int).
+        """
+        while len(self.alive) and (horizon is None or self.scorer.frame < horizon):
+            self.step(delta_t)
+
+        return len(self.alive)
@@ -0,0 +1,262 @@
+"""
+population_body.py
+
+Struct-of-arrays physics for the bodies of a whole population of agents.
+The points of every agent's skeleton live in (N, P, 2) NumPy arrays so
+the Verlet integration, the track clamp and the stick constraints run as
+vectorized operations over all live agents instead of point by point.
+"""
+
+import numpy as np
+
+import kernels
+from body import DEFAULT_SOLVER
+from chain_solver import is_chain, inverse_masses, solve_chains
+from vector import Vector2
+from constants import *
+
+
+class PopulationBody:
+    """The bases and skeletons of a population of identically built agents.
+
+    Point 0 of each skeleton is the agent's base. It is locked to the
+    base position, which moves along the track, exactly like an Agent
+    forces its skeleton's first point to its own position.
+    """
+
+    def __init__(self, num_agents, points, sticks, move_strength=1.5, dtype=float, backend="numpy", solver=DEFAULT_SOLVER):
+        """Creates the bodies of `num_agents` agents at rest.
+
+        Parameters:
+        - num_agents (int): The number of agents in the population.
+        - points [(x, y)]: The points of one agent's skeleton.
+        - sticks [(p1, p2)]: Pairs of point indices to connect via a stick.
+
+        kwargs:
+        - move_strength=1.5 (float): How strong the force is when an agent
+                                     tries to move.
+        - dtype=float: The floating point type of the physics arrays.
+        - backend="numpy" (str): "numpy" or "numba", the kernels moving
+                the points. See kernels.py.
+        - solver=DEFAULT_SOLVER (ConstraintSolver): How the sticks are
+                kept at their lengths.
+
+        Returns: None
+        """
+        template = np.array(points, dtype=dtype)
+
+        self.points = np.tile(template, (num_agents, 1, 1))
+        self.old_points = self.points.copy()
+
+        # Sticks are defined as (p1, p2, distance). The distance is a
+        # Python float so it does not promote float32 arrays.
+        self.sticks = []
+        for (a, b) in sticks:
+            delta = template[b] - template[a]
+            self.sticks.append((a, b, float(np.sqrt(delta[0]*delta[0] + delta[1]*delta[1]))))
+
+        # The base is always locked to the track
+        self.locked_points = [0]
+
+        # The sticks and locked points as arrays, for the compiled kernels
+        self.backend = kernels.resolve_backend(backend)
+        self.__stick_a, self.__stick_b, self.__stick_len, self.__locked = kernels.stick_arrays(
+            self.sticks, len(template), self.locked_points)
+
+        self.solver = solver
+        # the kernels take a negative tolerance for none
+        self.__tolerance = -1.0 if solver.tolerance is None else float(solver.tolerance)
+        self.__chain = solver.method == "chain"
+        if self.__chain and not is_chain(self.sticks):
+            raise Exception("the chain solver needs stick i to join point i to point i + 1")
+        self.__inv_mass = inverse_masses(len(template), self.locked_points)
+
+        # Horizontal position and velocity of each agent's base
+        self.base_pos = np.zeros(num_agents, dtype=dtype)
+        self.base_vel = np.zeros(num_agents, dtype=dtype)
+
+        self.move_strength = move_strength
+
+
+    def __len__(self):
+        return len(self.points)
+
+
+    def net_inputs(self, rows):
+        """Builds the net input vectors of the given agents, matching
+        Agent.net_input.
+
+        Parameters:
+        - rows (ndarray): Indices of the agents.
+
+        Returns: An (M, P + 1) array of inputs.
+        """
+        point_positions = np.diff(self.points[rows, :, 0], axis=1)
+        return np.column_stack((self.base_vel[rows], self.base_pos[rows], point_positions))
+
+
+    def apply_force(self, x_forces, rows, delta_t, noise):
+        """Applies a noisy horizontal force to the bases of the given
+        agents and moves them along the track.
+
+        Parameters:
+        - x_forces (ndarray): The force applied by each agent.
+        - rows (ndarray): Indices of the agents.
+        - delta_t (float): The amount of time to step forward.
+        - noise (ndarray): The noise added to each agent's force.
+
+        Returns: None
+        """
+        net_force = x_forces + noise
+
+        vel = self.base_vel[rows] + net_force * self.move_strength * delta_t
+        pos = np.clip(self.base_pos[rows] + vel, -TRACK_WIDTH / 2, TRACK_WIDTH / 2)
+
+        self.base_vel[rows] = vel
+        self.base_pos[rows] = pos
+
+        # make the skeleton bases match the agents
+        self.points[rows, 0, 0] = pos
+        self.points[rows, 0, 1] = 0
+
+
+    def move(self, rows, delta_t, acc_noise):
+        """Verlet integration step for the given agents followed by the
+        constraint relaxation.
+
+        Parameters:
+        - rows (ndarray): Indices of the agents.
+        - delta_t (float): The amount of time to step forward.
+        - acc_noise (ndarray): An (M, P - 1) array with the noise added to
+                               the acceleration of each free point.
+
+        Returns: The number of constraint passes run over all agents (int)
+        """
+        if self.backend == "numba":
+            return kernels.move_rows(self.points, self.old_points, rows, acc_noise, delta_t,
+                                     self.__stick_a, self.__stick_b, self.__stick_len, self.__locked,
+                                     self.solver.iterations, self.__tolerance, self.__chain)
+
+        points = self.points[rows]
+        old_points = self.old_points[rows]
+        free = [i for i in range(points.shape[1]) if i not in self.locked_points]
+
+        # The same noise is added to both components of a point's acceleration
+        acceleration = np.array((0, 100), dtype=points.dtype) + acc_noise[:, :, None]
+
+        current_pos = points[:, free]
+        points[:, free] += (current_pos - old_points[:, free])*0.999 + acceleration*delta_t**2
+        old_points[:, free] = current_pos
+
+        # After moving the points, satisfy the constraints
+        passes = self.__satisfy_constraints(points)
+
+        self.points[rows] = points
+        self.old_points[rows] = old_points
+        return passes
+
+
+    def stick_error(self, rows):
+        """Returns the largest difference between the length of a stick
+        and its rest length, relative to the rest length, over the given
+        agents (float)."""
+        if len(rows) == 0:
+            return 0.0
+        if self.backend == "numba":
+            return kernels.max_stick_error(self.points, rows, self.__stick_a, self.__stick_b, self.__stick_len)
+        return float(self.__stick_errors(self.points[rows]).max())
+
+
+    def __stick_errors(self, points):
+        """Returns the largest relative stick length error of each agent
+        in an (M, P, 2) array of points."""
+        delta = points[:, self.__stick_b] - points[:, self.__stick_a]
+        len_delta = np.sqrt(delta[..., 0]*delta[..., 0] + delta[..., 1]*delta[..., 1])
+        return (np.abs(len_delta - self.__stick_len) / self.__stick_len).max(axis=1, initial=0)
+
+
+    def __satisfy_constraints(self, points):
+        """Relaxes the sticks of an (M, P, 2) array of points in place.
+        Sticks are processed one after another, each one for all agents
+        at once, or solved all together for each agent by the chain
+        solver. With a tolerance, agents drop out of the passes once
+        their sticks are within it, like in the compiled kernels.
+
+        Returns: The number of passes run over all agents (int)
+        """
+        run_passes = self.__solve_chains if self.__chain else self.__relax
+
+        if self.solver.tolerance is None:
+            run_passes(points, self.solver.iterations)
+            return self.solver.iterations * len(points)
+
+        passes = 0
+        active = np.arange(len(points))
+        for _ in range(self.solver.iterations):
+            active = active[self.__stick_errors(points[active]) > self.solver.tolerance]
+            if len(active) == 0:
+                break
+            passes += len(active)
+
+            if len(active) == len(points):
+                run_passes(points, 1)
+            else:
+                subset = points[active]
+                run_passes(subset, 1)
+                points[active] = subset
+        return passes
+
+
+    def __solve_chains(self, points, iterations):
+        """Runs `iterations` direct chain solves over an (M, P, 2) array
+        of points in place."""
+        for _ in range(iterations):
+            solve_chains(points, self.__stick_len, self.__inv_mass)
+
+
+    def __relax(self, points, iterations):
+        """Runs `iterations` relaxation passes over an (M, P, 2) array of
+        points in place."""
+        for _ in range(iterations):
+            for stick in self.sticks:
+                # Vector between the points
+                delta = points[:, stick[1]] - points[:, stick[0]]
+                len_delta = np.sqrt(delta[:, 0]*delta[:, 0] + delta[:, 1]*delta[:, 1])
+                diff = (len_delta-stick[2])/len_delta
+
+                # Update the points position according to difference
+                # from the constraint distance
+                correction = delta*0.5*diff[:, None]
+                if stick[0] not in self.locked_points:
+                    points[:, stick[0]] += correction
+                if stick[1] not in self.locked_points:
+                    points[:, stick[1]] -= correction
+
+
+    def row_view(self, row):
+        """Returns a SkeletonView of one agent's body."""
+        return SkeletonView(self, row)
+
+
+class SkeletonView:
+    """Exposes one agent of a PopulationBody through the attributes of a
+    Skeleton, so the agent can be drawn and scored as usual."""
+
+    def __init__(self, body, row):
+        self.body = body
+        self.row = row
+
+
+    @property
+    def points(self):
+        return [Vector2(tuple(p)) for p in self.body.points[self.row]]
+
+
+    @property
+    def sticks(self):
+        return self.body.sticks
+
+
+    @property
+    def locked_points(self):
+        return self.body.locked_points
@@ -0,0 +1,75 @@
+"""
+population_net.py
+
+Evaluates a whole population of identically shaped neural nets at once.
+The weights of every net are stacked into 3-D arrays so that each layer
+of the forward pass is a single batched matrix multiplication instead of
+one small matrix-vector product per agent.
+"""
+
+import numpy as np
+
+
+class PopulationNet:
+    """Stacks the weights of same-shaped NeuralNets for batched evaluation.
+    Create one with from_genomes."""
+
+    @classmethod
+    def from_genomes(cls, genomes, shapes, activations):
+        """Creates a PopulationNet over a matrix of flattened nets, as
+        returned by NeuralNet.genome, without copying the weights.
+
+        Parameters:
+        - genomes (ndarray): An (N, G) array with one genome per row.
+        - shapes [(out, in)]: The shape of each weight layer.
+        - activations [function]: The activation function of each layer
+                                  after the input layer.
+
+        Returns: A PopulationNet
+        """
+        population_net = cls.__new__(cls)
+        population_net.genomes = genomes
+        population_net.weights = cls.__layer_views(genomes, shapes)
+        population_net.activations = list(activations)
+        return population_net
+
+
+    @staticmethod
+    def __layer_views(genomes, shapes):
+        """Returns one (N, out, in) view of a genome matrix per layer."""
+        weights = []
+        offset = 0
+        for (rows, cols) in shapes:
+            layer = genomes[:, offset:offset + rows*cols]
+            weights.append(layer.reshape(len(genomes), rows, cols))
+            offset += rows*cols
+        return weights
+
+
+    def __len__(self):
+        return len(self.weights[0])
+
+
+    def evaluate(self, data, rows=None):
+        """Runs the forward pass for many nets at once.
+
+        Parameters:
+        - data (ndarray): An (M, input_size) array holding one input
+                          vector per net being evaluated.
+
+        kwargs:
+        - rows=None (ndarray): Indices of the nets the rows of `data`
+                               belong to. All nets are used when None.
+
+        Returns: An (M, output_size) array of output layer activations.
+        """
+        acts = np.asarray(data, dtype=self.genomes.dtype)
+
+        for weight, act_f in zip(self.weights, self.activations):
+            if rows is not None:
+                weight = weight[rows]
+
+            # (M, out, in) @ (M, in, 1) -> (M, out)
+            acts = act_f(np.matmul(weight, acts[:, :, None])[:, :, 0])
+
+        return acts
@@ -0,0 +1,181 @@
+"""
+population_scorer.py
+
+Scores a whole population of agents from the arrays of a PopulationBody,
+using the same rules as the Scorer: one point per frame the pole stays
+above the base, minus the distance travelled by the base.
+"""
+
+import numpy as np
+
+
+class PopulationScorer:
+    """Evaluates the fitness of every agent in a population."""
+
+    def __init__(self, num_agents):
+        """Default constructor."""
+        self.frames_alive = np.zeros(num_agents, dtype=int)
+        self.running = np.ones(num_agents, dtype=bool)
+
+        # Number of updates so far. Agents are updated together, so this
+        # is also the frames_alive of every running agent.
+        self.frame = 0
+
+        self.__last_pos = np.zeros(num_agents)
+        self.__total_dist = np.zeros(num_agents, dtype=int)
+
+        # Optional record of each agent's travelled distance per frame
+        self.__history = None
+        self.__history_start = 0
+
+
+    def __len__(self):
+        return len(self.running)
+
+
+    def update(self, body, rows, threshold=None):
+        """Updates the scores of the given agents.
+
+        Parameters:
+        - body (PopulationBody): The bodies of the agents.
+        - rows (ndarray): Indices of the agents, all of which must still
+                          be running.
+
+        kwargs:
+        - threshold=None (int): Stop agents once their score exceeds it.
+
+        Returns: None
+        """
+        self.frame += 1
+        self.frames_alive[rows] += 1
+
+        # Update the total distance traveled by the base. The first
+        # update only records the position.
+        current_pos = body.base_pos[rows]
+        dist = np.abs(current_pos - self.__last_pos[rows]).astype(int)
+        dist[self.frames_alive[rows] == 1] = 0
+        self.__total_dist[rows] += dist
+        self.__last_pos[rows] = current_pos
+
+        column = self.frame - self.__history_start - 1
+        if self.__history is not None and column < self.__history.shape[1]:
+            self.__history[rows, column] = self.__total_dist[rows]
+
+        # scoring should end once the second point is beneath the base
+        delta_y = body.points[rows, 1, 1] - body.points[rows, 0, 1]
+        done = delta_y >= 0
+
+        # stop successful agents to avoid infinite simulation
+        if threshold is not None:
+            done |= self.get_scores(rows) > threshold
+
+        self.running[rows[done]] = False
+
+
+    def get_scores(self, rows=None):
+        """Returns the recorded scores calculated as duration - distance
+        travelled, for the given agents or for all of them."""
+        if rows is None:
+            return self.frames_alive - self.__total_dist
+        return self.frames_alive[rows] - self.__total_dist[rows]
+
+
+    def get_score(self, row):
+        """Returns the recorded score of one agent."""
+        return int(self.frames_alive[row] - self.__total_dist[row])
+
+
+    def kernel_arrays(self):
+        """Returns the arrays the scores are kept in, for compiled kernels
+        that update them in place: (frames_alive, total_dist, last_pos,
+        running, history, history_start). The history has no columns
+        while none is being recorded."""
+        history = self.__history if self.__history is not None else np.zeros((len(self), 0), dtype=int)
+        return self.frames_alive, self.__total_dist, self.__last_pos, self.running, history, self.__history_start
+
+
+    def record_history(self, num_frames):
+        """Starts recording the travelled distance of every agent for the
+        next `num_frames` frames, replacing any earlier record, so that
+        scores_at can look back at those frames."""
+        self.__history = np.zeros((len(self), num_frames), dtype=int)
+        self.__history_start = self.frame
+
+
+    def scores_at(self, frame):
+        """Returns the scores every agent had after `frame` updates.
+        Agents that were done by then keep their final score.
+
+        Parameters:
+        - frame (int): A frame covered by the current history record,
+                       or any frame at or after the current one.
+
+        Returns: An ndarray of scores.
+        """
+        scores = self.get_scores()
+
+        past = self.frames_alive > frame
+        if np.any(past):
+            column = frame - self.__history_start - 1
+            scores[past] = frame - self.__history[past, column]
+
+        return scores
+
+
+    @staticmethod
+    def stop_frame(frames_alive, num_reproducing):
+        """Returns the frame at which a generation run in lockstep stops
+        early, i.e. the first frame after which at most `num_reproducing`
+        agents are still running.
+
+        Parameters:
+        - frames_alive (ndarray): The lifetime of each agent. Agents that
+                are still running may give any lower bound of their
+                lifetime as long as at most `num_reproducing` of them do.
+        - num_reproducing (int): The number of agents that reproduce.
+
+        Returns: The stopping frame (int).
+        """
+        if num_reproducing >= len(frames_alive):
+            return 1
+
+        # The (num_reproducing + 1)-th longest lifetime
+        lifetimes = np.sort(frames_alive)[::-1]
+        return max(1, int(lifetimes[num_reproducing]))
+
+
+    def row_view(self, row):
+        """Returns a ScorerView of one agent's score."""
+        return ScorerView(self, row)
+
+
+class ScorerView:
+    """Exposes one agent of a PopulationScorer through the interface of
+    a Scorer."""
+
+    def __init__(self, scorer, row):
+        self.scorer = scorer
+        self.row = row
+
+
+    @property
+    def running(self):
+        return bool(self.scorer.running[self.row])
+
+
+    @running.setter
+    def running(self, value):
+        self.scorer.running[self.row] = value
+
+
+    @property
+    def frames_alive(self):
+        return int(self.scorer.frames_alive[self.row])
+
+
+    def is_done(self):
+        return not self.running
+
+
+    def get_score(self):
+        return self.scorer.get_score(self.row)
@@ -0,0 +1,113 @@
+"""
+profiler.py
+
+Cheap per-phase timers and counters for the training loop. Code marks its
+phases with `with profiler.phase(name):` and counts work with
+`profiler.count(name, n)`, and keep the largest value of a measurement
+with `profiler.peak(name, value)`. A PhaseProfiler adds up the time and
+counts of every phase until it is reset, once per generation. When profiling is off
+the NULL_PROFILER is used instead, whose methods do nothing.
+"""
+
+import time
+from contextlib import nullcontext
+
+
+class PhaseProfiler:
+    """Accumulates the time spent in each phase and named counters."""
+
+    def __init__(self):
+        self.times = {}
+        self.counts = {}
+        self.peaks = {}
+        self.__start = time.perf_counter()
+
+
+    def phase(self, name):
+        """Returns a context manager timing the code it wraps as part of
+        the phase `name`."""
+        return _PhaseTimer(self.times, name)
+
+
+    def count(self, name, n=1):
+        """Adds n to the counter `name`."""
+        self.counts[name] = self.counts.get(name, 0) + n
+
+
+    def peak(self, name, value):
+        """Keeps the largest value given for the measurement `name`."""
+        self.peaks[name] = max(self.peaks.get(name, value), value)
+
+
+    def reset(self):
+        """Clears every timer and counter."""
+        self.times.clear()
+        self.counts.clear()
+        self.peaks.clear()
+        self.__start = time.perf_counter()
+
+
+    def report(self, num_agents):
+        """Returns a breakdown of the time and work since the last reset.
+
+        Parameters:
+        - num_agents (int): The number of agents in the generation.
+
+        Returns: A multi-line string.
+        """
+        elapsed = time.perf_counter() - self.__start
+        agent_frames = self.counts.get("agent frames", 0)
+
+        lines = [f"Profile: {elapsed:.3f} s, {agent_frames} agent frames "
+                 f"({agent_frames / elapsed:.0f}/s), {agent_frames / num_agents:.1f} frames per agent"]
+        for name, seconds in sorted(self.times.items(), key=lambda item: -item[1]):
+            lines.append(f"  {name:<14} {seconds:8.3f} s {seconds / elapsed:6.1%}")
+        for name, n in self.counts.items():
+            if name != "agent frames":
+                per_frame = f" ({n / agent_frames:.2f} per agent frame)" if agent_frames else ""
+                lines.append(f"  {name:<14} {n:8d}{per_frame}")
+        for name, value in self.peaks.items():
+            lines.append(f"  {name:<14} {value:8.2e} max")
+        return "\n".join(lines)
+
+
+class _PhaseTimer:
+    """Adds the time spent in a with block to a phase."""
+
+    __slots__ = ("times", "name", "start")
+
+    def __init__(self, times, name):
+        self.times = times
+        self.name = name
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+
+    def __exit__(self, *exc_info):
+        self.times[self.name] = self.times.get(self.name, 0) + time.perf_counter() - self.start
+
+
+class NullProfiler:
+    """A profiler that records nothing, used when profiling is off."""
+
+    __context = nullcontext()
+
+    def phase(self, name):
+        return self.__context
+
+
+    def count(self, name, n=1):
+        pass
+
+
+    def peak(self, name, value):
+        pass
+
+
+    def reset(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,153 @@
+"""
+regression.py
+
+Checks that the ways of simulating a generation agree with each other.
+Short seeded headless runs are trained with each backend, constraint
+solver and number of workers, with one episode per agent and resumed
+from a checkpoint, and the scores of every generation must match those
+of a plain lockstep run with the same solver. Then the showcase of a
+saved network is run for a few seconds with each solver.
+
+Exits with status 1 if any check fails.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+import kernels
+from body import ConstraintSolver
+from main import Simulation
+from stats_file import read_stats
+
+
+def train(savefile, solver, num_agents, epochs, chain_length, seed, **options):
+    """Runs a seeded headless Simulation and returns the scores of every
+    generation, as a (epochs, num_agents) array."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        sim = Simulation(num_agents, do_graphics=False, num_reproducing=max(1, num_agents // 10), epochs=epochs,
+                         chain_length=chain_length, seed=seed, solver=ConstraintSolver(method=solver),
+                         savefile=savefile, **options)
+        sim.run()
+    return np.array(read_stats(sim.stats.path))
+
+
+def check_training(num_agents, epochs, chain_length, seed):
+    """Compares the stats of every way of running a generation with the
+    lockstep run of the same solver.
+
+    Returns: [(name of the check, None if it passed or why it failed)]
+    """
+    has_numba = kernels.resolve_backend("numba") == "numba"
+    runs = [
+        ("numpy backend, 2 workers", dict(workers=2)),
+        ("numba backend", dict(backend="numba")),
+        ("numba backend, 2 workers", dict(backend="numba", workers=2)),
+        ("episodes", dict(episodes=True)),
+    ]
+
+    results = []
+    for solver in ConstraintSolver.METHODS:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # checkpointed before the final generation, to resume from below
+            savefile = os.path.join(tmpdir, "lockstep")
+            expected = train(savefile, solver, num_agents, epochs, chain_length, seed, checkpoint_every=epochs - 1)
+
+            for name, options in runs:
+                name = f"{solver}: {name}"
+                if not has_numba and (options.get("backend") == "numba" or options.get("episodes")):
+                    results.append((name, "skipped, Numba is not installed"))
+                    continue
+                scores = train(os.path.join(tmpdir, "run"), solver, num_agents, epochs, chain_length, seed,
+                               checkpoint_every=0, **options)
+                results.append((name, compare(scores, expected)))
+
+            # the resumed run rewrites the final generation of the stats
+            scores = train(savefile, solver, num_agents, epochs, chain_length, None,
+                           resume=f"{savefile}_checkpoint.npz")
+            results.append((f"{solver}: resumed from generation {epochs - 1}", compare(scores, expected)))
+    return results
+
+
+def compare(scores, expected):
+    """Returns None if two runs scored every generation the same, or the
+    first generation they differ in."""
+    if scores.shape != expected.shape:
+        return f"{len(scores)} generations of {scores.shape[1]} scores instead of {len(expected)} of {expected.shape[1]}"
+    for generation, (row, expected_row) in enumerate(zip(scores, expected)):
+        if not np.array_equal(row, expected_row):
+            return f"generation {generation + 1} scored {row.tolist()} instead of {expected_row.tolist()}"
+    return None
+
+
+def check_showcase(path, seconds):
+    """Shows a saved network with each solver in a hidden window. The
+    showcase never ends on its own, so it passes when it is still
+    running after `seconds`.
+
+    Returns: [(name of the check, None if it passed or why it failed)]
+    """
+    main_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy")
+
+    results = []
+    for solver in ConstraintSolver.METHODS:
+        name = f"{solver}: showcase of {path}"
+        try:
+            process = subprocess.run([sys.executable, main_path, "-l", path, "--constraint-solver", solver],
+                                     capture_output=True, text=True, env=env, timeout=seconds)
+        except subprocess.TimeoutExpired:
+            results.append((name, None))
+            continue
+        error = process.stderr.strip().splitlines()
+        results.append((name, f"exited with status {process.returncode}: {error[-1] if error else 'no error'}"))
+    return results
+
+
+def main():
+    default_net = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "successful_nets", "mynet6")
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-a", "--agents", metavar="NUMBER_OF_AGENTS", type=int, default=20, help="number of agents of each run (default: 20)")
+    parser.add_argument("-e", "--epochs", metavar="NUMBER_OF_EPOCHS", type=int, default=3, help="epochs of each run, at least 2 to resume one (default: 3)")
+    parser.add_argument("-c", "--chainlength", metavar="NUMBER_OF_AGENTS", type=int, default=3, help="number of additional segments of the rods (default: 3)")
+    parser.add_argument("--seed", metavar="SEED", type=int, default=0, help="seed of the runs (default: 0)")
+    parser.add_argument("-l", "--loadname", metavar="NETWORK_NAME", type=str, default=default_net, help="the network file shown by the showcase check (default: successful_nets/mynet6)")
+    parser.add_argument("--showcase-seconds", metavar="SECONDS", type=float, default=5, help="how long each showcase must run (default: 5)")
+    args = parser.parse_args()
+
+    if args.epochs < 2:
+        print("[regression]: there must be at least 2 epochs")
+        sys.exit()
+
+    if not os.path.exists(args.loadname):
+        print(f"[regression]: {args.loadname} does not exist")
+        sys.exit()
+
+    failures = 0
+    for name, checks in (
+        ("training", lambda: check_training(args.agents, args.epochs, args.chainlength, args.seed)),
+        ("showcase", lambda: check_showcase(args.loadname, args.showcase_seconds)),
+    ):
+        print(f"[regression]: {name}")
+        for check, error in checks():
+            if error is None:
+                print(f"  {check}: ok")
+            elif error.startswith("skipped"):
+                print(f"  {check}: {error}")
+            else:
+                print(f"  {check}: FAILED, {error}")
+                failures += 1
+
+    print(f"[regression]: {failures} check{'s' if failures != 1 else ''} failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+renderer.py
+
+Draws many agents at once. The corners of every stick's polygon are
+computed for all drawn agents together from an array of their points,
+so only the pygame draw calls are left per shape. The translucent
+highlight of the active agent is drawn through surfaces that are kept
+between frames instead of being allocated on each one, and a large
+population can be thinned out to a fixed number of drawn agents.
+"""
+
+from math import ceil
+
+import numpy as np
+import pygame
+
+from constants import AGENT_BASE_WIDTH, AGENT_BASE_HEIGHT, AGENT_POLE_RADIUS, HIGHLIGHT_THICKNESS, HIGHLIGHT_COLOR, HIGHLIGHT_ALPHA
+
+
+def pole_polygons(points, sticks, radius, extra_length=0):
+    """Returns the corners of the polygon of every stick of every agent.
+
+    Parameters:
+    - points (ndarray): An (M, P, 2) array of the points of M agents.
+    - sticks [(p1, p2, ...)]: The point indices joined by each stick.
+    - radius (float): Half the thickness of a stick.
+
+    kwargs:
+    - extra_length=0 (float): Added to the length of every stick.
+
+    Returns: An (M, S, 4, 2) array of polygon corners.
+    """
+    pt1 = points[:, [s[0] for s in sticks]]
+    delta = points[:, [s[1] for s in sticks]] - pt1
+    length = np.hypot(delta[..., 0], delta[..., 1])
+
+    # The cosine and sine of the angle of each stick. A stick of zero
+    # length points along x, like atan2(0, 0) does.
+    zero = length == 0
+    safe_length = np.where(zero, 1, length)
+    cos = np.where(zero, 1, delta[..., 0] / safe_length)
+    sin = delta[..., 1] / safe_length
+    length = length + extra_length
+
+    r_sin, r_cos = radius * sin, radius * cos
+    l_cos, l_sin = length * cos, length * sin
+    corners = np.stack([
+        np.stack([r_sin, -r_cos], axis=-1),
+        np.stack([-r_sin, r_cos], axis=-1),
+        np.stack([l_cos - r_sin, r_cos + l_sin], axis=-1),
+        np.stack([l_cos + r_sin, -r_cos + l_sin], axis=-1),
+    ], axis=-2)
+    return corners + pt1[:, :, None, :]
+
+
+class AgentRenderer:
+    """Draws the agents of a population in batches."""
+
+    def __init__(self, max_agents=None):
+        """Creates a renderer.
+
+        kwargs:
+        - max_agents=None (int): The number of agents to draw at most
+                                 from a larger population. All are drawn
+                                 when None.
+
+        Returns: None
+        """
+        self.max_agents = max_agents
+
+        # The highlight of a base never changes size, and the highlight
+        # of a pole is drawn on a corner of a scratch surface that grows
+        # to the largest pole seen
+        self.__glow_base = pygame.Surface((AGENT_BASE_WIDTH + 8, AGENT_BASE_HEIGHT + 4), pygame.SRCALPHA)
+        self.__glow_base.fill(HIGHLIGHT_COLOR)
+        self.__glow_base.set_alpha(HIGHLIGHT_ALPHA)
+        self.__glow_scratch = None
+
+
+    def visible(self, rows, num_agents, highlighted=None):
+        """Returns the rows of the live agents to draw. When the
+        population is larger than max_agents, only every few agents are
+        drawn, chosen by row so the same agents stay visible from frame
+        to frame. The highlighted agent is always drawn.
+
+        Parameters:
+        - rows (ndarray): The rows of the live agents.
+        - num_agents (int): The size of the whole population.
+
+        kwargs:
+        - highlighted=None (int): The row of the highlighted agent.
+
+        Returns: An ndarray of rows.
+        """
+        if self.max_agents is None or num_agents <= self.max_agents:
+            return rows
+        stride = ceil(num_agents / self.max_agents)
+        keep = rows % stride == 0
+        if highlighted is not None:
+            keep |= rows == highlighted
+        return rows[keep]
+
+
+    def draw(self, canvas, agents, points, sticks):
+        """Draws agents that share a skeleton shape. The highlighted
+        agent is drawn last, on top of its highlight and its net.
+
+        Parameters:
+        - canvas (pygame.Surface): The surface to draw on.
+        - agents [Agent]: The agents to draw.
+        - points (ndarray): An (M, P, 2) array of the agents' points,
+                            one row per agent.
+        - sticks [(p1, p2, ...)]: The sticks of the skeleton.
+
+        Returns: None
+        """
+        if len(agents) == 0:
+            return
+
+        offset = np.array([canvas.get_width() / 2, canvas.get_height() * 2 / 3])
+        screen_points = np.asarray(points, dtype=float) + offset
+        polygons = pole_polygons(screen_points, sticks, AGENT_POLE_RADIUS).tolist()
+        bases = screen_points[:, 0].tolist()
+
+        highlighted = None
+        for i, a in enumerate(agents):
+            if a.is_highlighted:
+                highlighted = i
+                continue
+            self.__draw_body(canvas, a, bases[i], polygons[i])
+
+        if highlighted is not None:
+            a = agents[highlighted]
+            self.__draw_highlight(canvas, screen_points[highlighted:highlighted + 1], sticks)
+            a.net.draw(canvas)
+            self.__draw_body(canvas, a, bases[highlighted], polygons[highlighted])
+
+
+    def draw_agents(self, canvas, agents):
+        """Draws agents with their own skeletons, which may have chains
+        of different lengths.
+
+        Parameters:
+        - canvas (pygame.Surface): The surface to draw on.
+        - agents [Agent]: The agents to draw.
+
+        Returns: None
+        """
+        groups = {}
+        for a in agents:
+            groups.setdefault(a.chain_length, []).append(a)
+
+        for group in groups.values():
+            points = np.array([[(p.x, p.y) for p in a.skeleton.points] for a in group])
+            self.draw(canvas, group, points, group[0].skeleton.sticks)
+
+
+    def __draw_body(self, canvas, a, base, polygons):
+        pygame.draw.rect(canvas, a.base_color,
+                         (base[0] - 20, base[1] - 10, AGENT_BASE_WIDTH, AGENT_BASE_HEIGHT), 0)
+        for polygon in polygons:
+            pygame.draw.polygon(canvas, a.rod_color, polygon)
+
+
+    def __draw_highlight(self, canvas, points, sticks):
+        base = points[0, 0]
+        canvas.blit(self.__glow_base, (base[0] - 24, base[1] - 14))
+
+        # only the pole glows, not the chain
+        corners = pole_polygons(points, sticks[:1], AGENT_POLE_RADIUS + HIGHLIGHT_THICKNESS,
+                                extra_length=HIGHLIGHT_THICKNESS)[0, 0]
+        low = corners.min(axis=0)
+        size = (corners.max(axis=0) - low).astype(int) + 1
+
+        scratch = self.__glow_scratch
+        if scratch is None or scratch.get_width() < size[0] or scratch.get_height() < size[1]:
+            width, height = size
+            if scratch is not None:
+                width, height = max(width, scratch.get_width()), max(height, scratch.get_height())
+            scratch = self.__glow_scratch = pygame.Surface((width, height), pygame.SRCALPHA)
+            scratch.set_alpha(HIGHLIGHT_ALPHA)
+
+        area = pygame.Rect((0, 0), size.tolist())
+        scratch.fill((0, 0, 0, 0), area)
+        pygame.draw.polygon(scratch, HIGHLIGHT_COLOR, (corners - low).tolist())
+        canvas.blit(scratch, low.astype(int).tolist(), area)
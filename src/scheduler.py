@@ -0,0 +1,395 @@
+"""
+scheduler.py
+
+Evaluates generations with run-to-completion episodes instead of
+stepping every agent in lockstep.
+
+Simulation.run stops a generation early once at most `num_reproducing`
+agents are still running. Episodes run independently of each other, so
+instead of polling the population every frame the StopEarlyScheduler
+advances them in rounds to a horizon that doubles every round until the
+rule is met. Every agent is then scored as it was at the frame the
+lockstep run would have stopped, which gives exactly the same scores.
+
+The SuccessiveHalvingEvaluator spends fewer frames on a generation
+instead: every agent gets a short horizon, and only the best of them are
+advanced to the next, longer one. The TrialEvaluator spends more, running
+every agent's genome in several episodes with different noise at once.
+"""
+
+import math
+
+import numpy as np
+
+import kernels
+from agent import Agent
+from body import DEFAULT_SOLVER
+from population import Population
+from population_body import PopulationBody
+from population_net import PopulationNet
+from population_scorer import PopulationScorer
+from noise import NoiseStream, trial_seed
+from profiler import NULL_PROFILER
+from constants import SUCCESS_THRESHOLD, TRACK_WIDTH
+
+
+class StopEarlyScheduler:
+    """Reproduces the stop-early rule for agents that are advanced
+    independently of each other."""
+
+    # Frames simulated in the first round of a generation that may stop early
+    FIRST_HORIZON = 256
+
+    def __init__(self, num_reproducing):
+        """Default constructor.
+
+        Parameters:
+        - num_reproducing (int): The number of agents that reproduce.
+
+        Returns: None
+        """
+        self.num_reproducing = num_reproducing
+
+
+    def run(self, advance, stop_early):
+        """Advances a generation in rounds until it is over.
+
+        Parameters:
+        - advance (function): Called as advance(horizon). Runs every agent
+                until it is done or has run `horizon` frames (until done
+                when None) and returns (frames_alive, alive) where
+                frames_alive is an ndarray holding each agent's frame count
+                and alive is the number of agents still running.
+        - stop_early (bool): Stop once at most num_reproducing agents are
+                running. Runs every agent until it is done otherwise.
+
+        Returns: The frame (int) at which the generation stops.
+        """
+        horizon = self.FIRST_HORIZON if stop_early else None
+        while True:
+            frames_alive, alive = advance(horizon)
+            if alive == 0 or (stop_early and alive <= self.num_reproducing):
+                break
+            horizon *= 2
+
+        num_reproducing = self.num_reproducing if stop_early else 0
+        return PopulationScorer.stop_frame(frames_alive, num_reproducing)
+
+
+class EpisodeEvaluator:
+    """Scores a generation by running each agent in its own episode, to
+    the end or to the horizon of a round, in the compiled loop of
+    kernels.run_episode. Needs Numba."""
+
+    def __init__(self, num_reproducing, chain_length, shapes, activations, delta_t=1/60, solver=DEFAULT_SOLVER, profiler=NULL_PROFILER):
+        """Default constructor.
+
+        Parameters:
+        - num_reproducing (int): The number of agents that reproduce.
+        - chain_length (int): The chain length of every agent.
+        - shapes [(out, in)]: The shape of each weight layer of the nets.
+        - activations [function]: The activation function of each layer
+                                  after the input layer.
+
+        kwargs:
+        - delta_t=1/60 (float): The number of seconds in a frame.
+        - solver=DEFAULT_SOLVER (ConstraintSolver): How the sticks are
+                kept at their lengths.
+        - profiler=NULL_PROFILER: Times the episodes and counts the
+                frames and constraint passes.
+
+        Returns: None
+        """
+        if kernels.resolve_backend("numba") != "numba":
+            raise Exception("the episode evaluator needs Numba")
+
+        self.scheduler = StopEarlyScheduler(num_reproducing)
+        self.chain_length = chain_length
+        self.shapes = np.array(shapes, dtype=np.int64)
+        self.codes = kernels.activation_codes(activations)
+        self.delta_t = delta_t
+        self.solver = solver
+        self.profiler = profiler
+
+
+    def evaluate(self, agents, stop_early, seeds):
+        """Simulates one generation and returns the score of every agent.
+
+        Parameters:
+        - agents [Agent]: The agents to evaluate.
+        - stop_early (bool): Stop once at most num_reproducing agents are
+                             running, like Simulation.run does.
+        - seeds [seed]: The seed of each agent's noise stream.
+
+        Returns: (scores, complete) where scores is an ndarray of scores,
+                 one per agent, and complete is a boolean ndarray that is
+                 True for the agents whose episode ended by the stop frame.
+        """
+        num_agents = len(agents)
+        points, sticks = Agent.skeleton_shape(self.chain_length)
+        genomes = np.stack([a.net.genome() for a in agents]).astype(float)
+
+        # The bodies and scores are kept like in a Population
+        body = PopulationBody(num_agents, points, sticks, solver=self.solver)
+        stick_a, stick_b, stick_len, locked = kernels.stick_arrays(body.sticks, len(points), body.locked_points)
+        tolerance = -1.0 if self.solver.tolerance is None else float(self.solver.tolerance)
+        chain = self.solver.method == "chain"
+
+        scorer = PopulationScorer(num_agents)
+
+        # Each episode's noise, a block of frames at a time
+        streams = [NoiseStream(len(points) - 1, seed) for seed in seeds]
+        force_noise = np.zeros((num_agents, NoiseStream.BLOCK_SIZE))
+        rod_noise = np.zeros((num_agents, NoiseStream.BLOCK_SIZE, len(points) - 1))
+        noise_frame = np.full(num_agents, NoiseStream.BLOCK_SIZE)
+
+        # Work space of the kernels
+        acts = np.zeros(max(len(points) + 1, int(self.shapes.max())))
+        work = np.zeros_like(acts)
+        scratch = np.empty((6, len(sticks)))
+
+        def advance(horizon):
+            if horizon is not None:
+                # Only the last round is ever looked back into. Every
+                # running agent has run to the previous horizon.
+                scorer.record_history(horizon - scorer.frame)
+            frames_alive, total_dist, last_pos, running, history, history_start = scorer.kernel_arrays()
+
+            frames_before = int(frames_alive.sum())
+            passes = 0
+            with self.profiler.phase("episodes"):
+                for row in np.flatnonzero(running):
+                    while running[row] and (horizon is None or frames_alive[row] < horizon):
+                        if noise_frame[row] == NoiseStream.BLOCK_SIZE:
+                            force_noise[row], rod_noise[row] = streams[row].next_block()
+                            noise_frame[row] = 0
+
+                        stop = NoiseStream.BLOCK_SIZE
+                        if horizon is not None:
+                            stop = min(stop, noise_frame[row] + horizon - frames_alive[row])
+
+                        noise_frame[row], row_passes = kernels.run_episode(
+                            row, noise_frame[row], stop, self.delta_t, body.move_strength, TRACK_WIDTH, SUCCESS_THRESHOLD,
+                            genomes, self.shapes, self.codes, force_noise[row], rod_noise[row],
+                            body.points, body.old_points, body.base_pos, body.base_vel,
+                            stick_a, stick_b, stick_len, locked, self.solver.iterations, tolerance, chain,
+                            frames_alive, total_dist, last_pos, running, history, history_start,
+                            acts, work, scratch,
+                        )
+                        passes += row_passes
+
+            # the running agents are all at the horizon, like in lockstep
+            scorer.frame = horizon if horizon is not None else int(frames_alive.max())
+
+            self.profiler.count("agent frames", int(frames_alive.sum()) - frames_before)
+            self.profiler.count("solver passes", passes)
+            return frames_alive, np.count_nonzero(running)
+
+        stop_frame = self.scheduler.run(advance, stop_early)
+
+        # agents still running at the stop frame are scored as they were then
+        complete = ~scorer.running & (scorer.frames_alive <= stop_frame)
+        return scorer.scores_at(stop_frame), complete
+
+
+    def close(self):
+        """Nothing to release, kept for symmetry with ShardedEvaluator."""
+        pass
+
+
+class SuccessiveHalvingEvaluator:
+    """Scores a generation in rounds of growing horizons, keeping only
+    the best fraction of the agents after each round."""
+
+    def __init__(self, num_reproducing, chain_length, shapes, activations, horizons, keep_fractions, delta_t=1/60, dtype=float, backend="numpy", solver=DEFAULT_SOLVER, profiler=NULL_PROFILER):
+        """Default constructor.
+
+        Parameters:
+        - num_reproducing (int): The number of agents that reproduce.
+                                 At least this many agents are kept.
+        - chain_length (int): The chain length of every agent.
+        - shapes [(out, in)]: The shape of each weight layer of the nets.
+        - activations [function]: The activation function of each layer
+                                  after the input layer.
+        - horizons [int]: The increasing frame each round runs to. A
+                          last round runs the kept agents to the end.
+        - keep_fractions [float]: The fraction of the agents still in
+                                  contention kept after each round.
+
+        kwargs:
+        - delta_t=1/60 (float): The number of seconds in a frame.
+        - dtype=float: The floating point type of the simulation.
+        - backend="numpy" (str): The physics kernels, see kernels.py.
+        - solver=DEFAULT_SOLVER (ConstraintSolver): How the sticks are
+                kept at their lengths.
+        - profiler=NULL_PROFILER: Times the phases of every step.
+
+        Returns: None
+        """
+        if len(horizons) != len(keep_fractions):
+            raise Exception("there must be one keep fraction per horizon")
+        if list(horizons) != sorted(horizons):
+            raise Exception("the horizons must be increasing")
+
+        self.num_reproducing = num_reproducing
+        self.chain_length = chain_length
+        self.shapes = shapes
+        self.activations = activations
+        self.horizons = horizons
+        self.keep_fractions = keep_fractions
+        self.delta_t = delta_t
+        self.dtype = dtype
+        self.backend = backend
+        self.solver = solver
+        self.profiler = profiler
+
+
+    def evaluate(self, agents, stop_early, seeds):
+        """Simulates one generation and returns the score of every agent.
+        Agents dropped after a round keep the score they had then.
+
+        Parameters:
+        - agents [Agent]: The agents to evaluate.
+        - stop_early (bool): Stop the last round once at most
+                             num_reproducing agents are running.
+        - seeds [seed]: The seed of each agent's noise stream.
+
+        Returns: (scores, complete) where scores is an ndarray of scores,
+                 one per agent, and complete is a boolean ndarray that is
+                 True for the agents whose episode ended.
+        """
+        genomes = np.stack([a.net.genome() for a in agents]).astype(self.dtype)
+        population_net = PopulationNet.from_genomes(genomes, self.shapes, self.activations)
+        population = Population(population_net, self.chain_length, seeds=seeds, backend=self.backend, solver=self.solver,
+                                profiler=self.profiler)
+        scorer = population.scorer
+
+        # Agents that have not been dropped, whether running or done
+        contenders = np.arange(len(agents))
+        for horizon, keep in zip(self.horizons, self.keep_fractions):
+            if population.run(self.delta_t, horizon=horizon) == 0:
+                break
+
+            num_kept = max(self.num_reproducing, math.ceil(keep * len(contenders)))
+            if num_kept >= len(contenders):
+                continue
+
+            # the best contenders go on, ties keep their order
+            order = np.argsort(-scorer.get_scores(contenders), kind="stable")
+            population.stop(contenders[order[num_kept:]])
+            contenders = np.sort(contenders[order[:num_kept]])
+
+        while len(population.alive) and not (stop_early and len(population.alive) <= self.num_reproducing):
+            population.step(self.delta_t)
+
+        return scorer.get_scores(), ~scorer.running
+
+
+    def close(self):
+        """Nothing to release, kept for symmetry with ShardedEvaluator."""
+        pass
+
+
+class TrialEvaluator:
+    """Scores every genome of a generation over several episodes with
+    different noise, simulated together as one population."""
+
+    # Statistics genomes can be selected on
+    STATISTICS = ("mean", "min", "success")
+
+    def __init__(self, num_reproducing, chain_length, shapes, activations, trials, delta_t=1/60, dtype=float, backend="numpy", solver=DEFAULT_SOLVER, profiler=NULL_PROFILER):
+        """Default constructor.
+
+        Parameters:
+        - num_reproducing (int): The number of agents that reproduce.
+        - chain_length (int): The chain length of every agent.
+        - shapes [(out, in)]: The shape of each weight layer of the nets.
+        - activations [function]: The activation function of each layer
+                                  after the input layer.
+        - trials (int): The number of episodes per genome.
+
+        kwargs:
+        - delta_t=1/60 (float): The number of seconds in a frame.
+        - dtype=float: The floating point type of the simulation.
+        - backend="numpy" (str): The physics kernels, see kernels.py.
+        - solver=DEFAULT_SOLVER (ConstraintSolver): How the sticks are
+                kept at their lengths.
+        - profiler=NULL_PROFILER: Times the phases of every step.
+
+        Returns: None
+        """
+        self.num_reproducing = num_reproducing
+        self.chain_length = chain_length
+        self.shapes = shapes
+        self.activations = activations
+        self.trials = trials
+        self.delta_t = delta_t
+        self.dtype = dtype
+        self.backend = backend
+        self.solver = solver
+        self.profiler = profiler
+
+        # Statistics of the last generation evaluated, by name
+        self.statistics = {}
+
+
+    def evaluate(self, agents, stop_early, seeds):
+        """Simulates one generation and returns the mean score of every
+        agent over its trials. The mean, the minimum and the success rate
+        (the fraction of trials reaching SUCCESS_THRESHOLD) are kept in
+        self.statistics.
+
+        Parameters:
+        - agents [Agent]: The agents to evaluate.
+        - stop_early (bool): Stop once at most num_reproducing agents
+                             have a trial still running.
+        - seeds [seed]: The seed of each agent's first trial, as returned
+                        by episode_seed.
+
+        Returns: (scores, complete) where scores is an ndarray of mean
+                 scores rounded to integers, one per agent, and complete
+                 is a boolean ndarray that is True for the agents whose
+                 trials all ended.
+        """
+        num_agents = len(agents)
+
+        # trial t of agent i is row i*trials + t
+        genomes = np.repeat(np.stack([a.net.genome() for a in agents]).astype(self.dtype), self.trials, axis=0)
+        trial_seeds = [trial_seed(seed, trial) for seed in seeds for trial in range(self.trials)]
+        population_net = PopulationNet.from_genomes(genomes, self.shapes, self.activations)
+        population = Population(population_net, self.chain_length, seeds=trial_seeds, backend=self.backend, solver=self.solver,
+                                profiler=self.profiler)
+        running = population.scorer.running.reshape(num_agents, self.trials)
+
+        while len(population.alive):
+            population.step(self.delta_t)
+            if stop_early and np.count_nonzero(running.any(axis=1)) <= self.num_reproducing:
+                break
+
+        scores = population.scorer.get_scores().reshape(num_agents, self.trials)
+        self.statistics = {
+            "mean": scores.mean(axis=1),
+            "min": scores.min(axis=1),
+            "success": np.mean(scores >= SUCCESS_THRESHOLD, axis=1),
+        }
+
+        return np.rint(self.statistics["mean"]).astype(int), ~running.any(axis=1)
+
+
+    def order(self, statistic):
+        """Returns the agents of the last generation evaluated from best
+        to worst on a statistic, ties broken by the mean score and then
+        by order.
+
+        Parameters:
+        - statistic (str): One of STATISTICS.
+
+        Returns: An ndarray of agent indices.
+        """
+        # lexsort is stable and sorts on the last key first
+        return np.lexsort((-self.statistics["mean"], -self.statistics[statistic]))
+
+
+    def close(self):
+        """Nothing to release, kept for symmetry with ShardedEvaluator."""
+        pass
@@ -10,7 +10,7 @@ to encourage minimal effort solutions.
 """
 
 from time import time
-from pygame.math import Vector2
+from vector import Vector2
 import body
 
 class Scorer:
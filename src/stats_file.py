@@ -0,0 +1,166 @@
+"""
+stats_file.py
+
+An append-only file of the scores of every agent in every generation.
+The file starts with a small header followed by one fixed-size record of
+int32 scores per generation, sorted from best to worst like the lists
+Simulation used to pickle. A record is flushed as soon as its generation
+ends, so the file can be read while training is still running, and
+reading it maps it into memory instead of loading it.
+
+Runs that score every agent over several trials also store the minimum
+score and the number of successful trials of each agent in every record,
+in the same order as the scores.
+"""
+
+import os
+
+import numpy as np
+
+# Marks a stats file, followed by the format version, the number of
+# scores in each record and the number of trials of each score
+MAGIC = b"EVOSTATS"
+VERSION = 2
+HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("num_agents", "<u4"), ("trials", "<u4")])
+# Version 1 files have no trials and only the scores in each record
+HEADER_V1 = np.dtype([("magic", "S8"), ("version", "<u4"), ("num_agents", "<u4")])
+SCORE = np.dtype("<i4")
+
+# The fields of the records of runs with several trials
+FIELDS = ("score", "min", "successes")
+
+
+def is_stats_file(path):
+    """Returns True if the file at `path` is a stats file."""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_header(path):
+    """Returns (num_agents, trials, header size in bytes) of a stats file."""
+    header = np.fromfile(path, dtype=HEADER_V1, count=1)
+    if len(header) == 0 or header["magic"][0] != MAGIC:
+        raise Exception(f"{path} is not a stats file")
+    if header["version"][0] == 1:
+        return int(header["num_agents"][0]), 1, HEADER_V1.itemsize
+    if header["version"][0] != VERSION:
+        raise Exception(f"{path} has unsupported stats file version {header['version'][0]}")
+
+    header = np.fromfile(path, dtype=HEADER, count=1)
+    return int(header["num_agents"][0]), int(header["trials"][0]), HEADER.itemsize
+
+
+def num_fields(trials):
+    """Returns the number of values stored per agent in each record."""
+    return len(FIELDS) if trials > 1 else 1
+
+
+def read_records(path):
+    """Maps the complete records of a stats file into memory. A record
+    that is still being written is left out.
+
+    Parameters:
+    - path (str): The stats file.
+
+    Returns: (a read only (generations, fields, num_agents) int32 array,
+              the number of trials of each score)
+    """
+    num_agents, trials, header_size = read_header(path)
+    fields = num_fields(trials)
+    generations = (os.path.getsize(path) - header_size) // (fields * num_agents * SCORE.itemsize)
+    if generations == 0:
+        return np.zeros((0, fields, num_agents), dtype=SCORE), trials
+    return np.memmap(path, dtype=SCORE, mode="r", offset=header_size, shape=(generations, fields, num_agents)), trials
+
+
+def read_stats(path):
+    """Maps the scores of the complete records of a stats file into
+    memory.
+
+    Parameters:
+    - path (str): The stats file.
+
+    Returns: A read only (generations, num_agents) int32 array.
+    """
+    return read_records(path)[0][:, 0]
+
+
+def read_trial_stats(path):
+    """Returns the minimum scores and the success rates of the complete
+    records of a stats file of a run with several trials.
+
+    Parameters:
+    - path (str): The stats file.
+
+    Returns: (a (generations, num_agents) int32 array of minimum scores,
+              a (generations, num_agents) array of success rates), or
+             None if the run scored each agent once.
+    """
+    records, trials = read_records(path)
+    if trials == 1:
+        return None
+    return records[:, FIELDS.index("min")], records[:, FIELDS.index("successes")] / trials
+
+
+class StatsWriter:
+    """Appends the scores of each generation to a stats file."""
+
+    def __init__(self, path, num_agents, trials=1, generations=0):
+        """Creates a stats file, or continues an existing one.
+
+        Parameters:
+        - path (str): The stats file.
+        - num_agents (int): The number of scores in each record.
+
+        kwargs:
+        - trials=1 (int): The number of trials of each score. With more
+                than one, every record also holds the minimum score and
+                the number of successful trials of each agent.
+        - generations=0 (int): The number of records to keep from an
+                existing file, for a resumed run. Anything after them is
+                dropped. A new file is started when 0.
+
+        Returns: None
+        """
+        self.path = path
+        self.num_agents = num_agents
+        self.trials = trials
+        record_size = num_fields(trials) * num_agents * SCORE.itemsize
+
+        if generations > 0:
+            saved_agents, saved_trials, header_size = read_header(path)
+            if saved_agents != num_agents:
+                raise Exception(f"{path} holds the scores of a different number of agents")
+            if saved_trials != trials:
+                raise Exception(f"{path} holds the scores of a different number of trials")
+            self.file = open(path, "r+b")
+            self.file.truncate(header_size + generations * record_size)
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(path, "wb")
+            header = np.array([(MAGIC, VERSION, num_agents, trials)], dtype=HEADER)
+            self.file.write(header.tobytes())
+            self.file.flush()
+
+
+    def append(self, scores, min_scores=None, successes=None):
+        """Writes the record of one generation and flushes it.
+
+        Parameters:
+        - scores [int]: One score per agent.
+
+        kwargs:
+        - min_scores=None [int]: The minimum score of each agent, needed
+                                 with several trials.
+        - successes=None [int]: The number of successful trials of each
+                                agent, needed with several trials.
+
+        Returns: None
+        """
+        record = [scores] if self.trials == 1 else [scores, min_scores, successes]
+        self.file.write(np.asarray(record, dtype=SCORE).tobytes())
+        self.file.flush()
+
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,104 @@
+"""
+vector.py
+
+A small pure Python 2D vector with the parts of the pygame.math.Vector2
+interface used by the physics and scoring code. It lets the simulation
+run headless without importing pygame, and pygame's drawing functions
+accept it wherever they take a point.
+"""
+
+import math
+
+
+class Vector2:
+    """A mutable 2D vector of floats."""
+
+    __slots__ = ("x", "y")
+
+    def __init__(self, x=0, y=None):
+        """Creates a vector from two numbers, or from any pair such as a
+        tuple or another vector."""
+        if y is None:
+            x, y = x
+        self.x = float(x)
+        self.y = float(y)
+
+
+    def update(self, x=0, y=None):
+        """Sets the components in place, accepting the same arguments as
+        the constructor."""
+        if y is None:
+            x, y = x
+        self.x = float(x)
+        self.y = float(y)
+
+
+    def length(self):
+        return math.sqrt(self.x*self.x + self.y*self.y)
+
+
+    def distance_to(self, other):
+        dx = other[0] - self.x
+        dy = other[1] - self.y
+        return math.sqrt(dx*dx + dy*dy)
+
+
+    def __len__(self):
+        return 2
+
+
+    def __getitem__(self, index):
+        return (self.x, self.y)[index]
+
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+
+
+    def __add__(self, other):
+        return Vector2(self.x + other[0], self.y + other[1])
+
+
+    __radd__ = __add__
+
+
+    def __sub__(self, other):
+        return Vector2(self.x - other[0], self.y - other[1])
+
+
+    def __rsub__(self, other):
+        return Vector2(other[0] - self.x, other[1] - self.y)
+
+
+    def __mul__(self, scalar):
+        return Vector2(self.x * scalar, self.y * scalar)
+
+
+    __rmul__ = __mul__
+
+
+    def __iadd__(self, other):
+        self.x += other[0]
+        self.y += other[1]
+        return self
+
+
+    def __isub__(self, other):
+        self.x -= other[0]
+        self.y -= other[1]
+        return self
+
+
+    def __neg__(self):
+        return Vector2(-self.x, -self.y)
+
+
+    def __eq__(self, other):
+        if not isinstance(other, Vector2):
+            return NotImplemented
+        return self.x == other.x and self.y == other.y
+
+
+    def __repr__(self):
+        return f"Vector2({self.x}, {self.y})"